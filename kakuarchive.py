@@ -0,0 +1,150 @@
+from kakugrid import KakuroGrid
+from kakufile import FileGrid
+import argparse
+import struct
+import mmap
+import os
+
+# Packed archive holding many puzzles in a single file
+#
+#  header  : magic "KAKA", version, number of grids, offset of the offset table
+#  records : one record per grid
+#              - size N (2 bytes)
+#              - problem  : kind, horizontal clues and vertical clues planes, N*N bytes each
+#              - solution : digits plane, N*N bytes
+#  offsets : one 8 bytes offset per record, grid k is at offsets[k-1]
+#            the table may be followed by unused slots, it ends at the first record written after it
+#
+# committed bytes are never overwritten, a crash during append() leaves the archive as it was before:
+#  - new records are written after the end of the file
+#  - their offsets go to the unused slots of the table, or when there are not enough slots, the whole table
+#    is written again after the new records with as many unused slots as used ones
+#  - the file is synced, then the header is rewritten with the new count and table offset
+# the table moves at most once each time the archive doubles, the old tables left in the file take
+# at most 16 bytes per grid
+# reads go through mmap, loading a grid does not depend on the number of grids in the archive
+class GridArchive():
+    MAGIC = b"KAKA"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHIQ")
+    RECORD = struct.Struct("<H")
+    OFFSET = struct.Struct("<Q")
+
+    def __init__(self,path="grids.kar"):
+        self.path = path
+        if not os.path.exists(self.path):
+            with open(self.path,"wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC,self.VERSION,0,0,self.HEADER.size))
+        self.file = None
+        self.mm = None
+        self.open()
+
+    def open(self):
+        self.close()
+        self.file = open(self.path,"rb")
+        self.mm = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self.indexoffset = self.HEADER.unpack_from(self.mm,0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise Exception("Not a grid archive ", self.path)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return self.count
+
+    # offset of the record of grid gid
+    def offset(self,gid):
+        return self.OFFSET.unpack_from(self.mm,self.indexoffset + (gid-1)*self.OFFSET.size)[0]
+
+    # number of offsets the table can hold
+    # the offsets grow with the IDs, the records written after the table are the last grids
+    def capacity(self):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.offset(mid+1) > self.indexoffset:
+                hi = mid
+            else:
+                lo = mid + 1
+        end = self.offset(lo+1) if lo < self.count else len(self.mm)
+        return (end - self.indexoffset) // self.OFFSET.size
+
+    def encode(self,kakuro):
+        return self.RECORD.pack(kakuro.N) + kakuro.kind.tobytes() + kakuro.hclues.tobytes() \
+            + kakuro.vclues.tobytes() + kakuro.digits.tobytes()
+
+    # append grids to the archive, in a single write
+    # returns the IDs of the new grids
+    def append(self,kakuros):
+        records = [self.encode(kakuro) for kakuro in kakuros]
+        if not records:
+            return []
+        count = self.count + len(records)
+        offsets = []
+        pos = len(self.mm)
+        for record in records:
+            offsets.append(self.OFFSET.pack(pos))
+            pos = pos + len(record)
+        first = self.count + 1
+        with open(self.path,"r+b") as f:
+            f.seek(len(self.mm))
+            f.write(b"".join(records))
+            if count <= self.capacity():
+                tableoffset = self.indexoffset
+                f.seek(tableoffset + self.count*self.OFFSET.size)
+                f.write(b"".join(offsets))
+            else:
+                tableoffset = pos
+                f.write(self.mm[self.indexoffset:self.indexoffset + self.count*self.OFFSET.size])
+                f.write(b"".join(offsets))
+                f.write(bytes(count*self.OFFSET.size))
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC,self.VERSION,0,count,tableoffset))
+            f.flush()
+            os.fsync(f.fileno())
+        self.open()
+        return list(range(first,self.count+1))
+
+    # returns the grid with this ID, IDs start at 1
+    def getGrid(self,gid):
+        gid = int(gid)
+        if gid < 1 or gid > self.count:
+            raise Exception("Cannot find grid ", gid)
+        offset = self.offset(gid)
+        N = self.RECORD.unpack_from(self.mm,offset)[0]
+        size = N*N
+        start = offset + self.RECORD.size
+        planes = [self.mm[start + k*size:start + (k+1)*size] for k in range(4)]
+        kind, hclues, vclues, digits = planes
+        return KakuroGrid.from_planes(N,kind,digits,hclues,vclues)
+
+    # write a grid of the archive as a .clp problem and its .sol solution
+    # returns the path of the problem
+    def export(self,gid,filegrid):
+        kakuro = self.getGrid(gid)
+        gridpath = filegrid.createNewFile()
+        filegrid.write(kakuro.serialize_problem())
+        filegrid.writeSolution(kakuro.serialize_solution())
+        return gridpath
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export puzzles of a grid archive to .clp files")
+    parser.add_argument("archive",help="archive file")
+    parser.add_argument("ids",help="IDs of the grids to export, all grids if none",nargs='*', type=int)
+    parser.add_argument("-d","--directory",help="directory where puzzles are exported", default="grids")
+    args = parser.parse_args()
+
+    archive = GridArchive(args.archive)
+    filegrid = FileGrid(griddir=args.directory)
+    ids = args.ids or range(1,len(archive)+1)
+    for gid in ids:
+        print("grid exported " + archive.export(gid,filegrid))
+    archive.close()
@@ -0,0 +1,182 @@
+from kakugrid import KakuroGrid, WHITE, BLACK
+import numpy as np
+import argparse
+import time
+
+# Zone statistics of lines of cells, zones are taken along the last axis
+#  - white  : (L,N) True for a white cell
+#  - digits : (L,N) digit of each cell
+# returns (present, repeated, length)
+#  - present  : (L,N,9) present[l,k,d-1] is True if digit d is used in the zone of cell k
+#  - repeated : (L,N) True for a white cell whose digit is already used before it in its zone
+#  - length   : (L,N) number of cells of the zone of each white cell, 0 for a black cell
+def zone_stats(white, digits):
+    L, N = white.shape
+    pos = np.arange(N)
+    black = ~white
+    # the zone of a white cell goes from start (after the last black cell) to end (next black cell, excluded)
+    start = np.maximum.accumulate(np.where(black, pos, -1), axis=1) + 1
+    end = np.minimum.accumulate(np.where(black, pos, N)[:, ::-1], axis=1)[:, ::-1]
+    length = np.where(white, end - start, 0)
+
+    # counts[l*(N+1)+k, d-1] : number of d digits in cells 0 .. k-1 of line l
+    onehot = (digits[..., None] == np.arange(1, 10, dtype=digits.dtype)) & white[..., None]
+    counts = np.zeros((L, N+1, 9), dtype=np.int16)
+    np.cumsum(onehot, axis=1, dtype=np.int16, out=counts[:, 1:])
+    counts = counts.reshape(L*(N+1), 9)
+    base = (np.arange(L) * (N+1))[:, None]
+
+    present = (counts[base + end] - counts[base + start]) > 0
+    # number of times the digit of each cell is used in its zone, up to the cell
+    own = np.clip(digits.astype(np.intp) - 1, 0, 8)
+    seen = counts[base + pos + 1, own] - counts[base + start, own]
+    repeated = white & (seen > 1)
+    return present, repeated, length
+
+# clue planes of a batch of grids, zones are taken along the last axis
+# the sum of a zone of 2 cells or more is put in the black cell before it, as in KakuroGrid.fill_clues()
+#  - white  : (V,N,N) True for a white cell, the first cell of each line is black
+#  - digits : (V,N,N) digit of each cell, 0 for a black cell
+def zone_clues(white, digits):
+    V, N, _ = white.shape
+    pos = np.arange(N)
+    sums = np.zeros((V, N, N+1), dtype=np.int16)
+    np.cumsum(digits, axis=2, dtype=np.int16, out=sums[:, :, 1:])
+    end = np.minimum.accumulate(np.where(white, N, pos)[:, :, ::-1], axis=2)[:, :, ::-1]
+    total = np.take_along_axis(sums, end, axis=2)[:, :, 1:] - sums[:, :, 1:N]
+    first = white[:, :, 1:] & ~white[:, :, :-1] & (end[:, :, 1:] - pos[1:] > 1)
+    clues = np.zeros((V, N, N), dtype=np.int8)
+    clues[:, :, :-1] = np.where(first, total, 0)
+    return clues
+
+# Generate B grids at once as (B,N,N) arrays
+# same steps as KakuroGrid.fill(), each step works on the whole batch:
+#  - digits and black cells are drawn for all the grids
+#  - isolated cells are removed with masks of the 4 neighbours
+#  - repeated digits are detected with cumulative counts along the zones and drawn again
+#  - the clues are sums of cumulative counts along the zones
+# only the grids that end up valid are turned into KakuroGrid objects
+class KakuroBatch:
+    def __init__(self, size=10, batch=256, bcells=0.3, maxattempts=10, seed=None):
+        self.N = size
+        self.B = batch
+        self.blackcells = bcells
+        self.maxattempts = maxattempts
+        self.rng = np.random.default_rng(seed)
+        self.stats = {"grids": 0, "valid": 0, "toolong": 0, "repeated": 0}
+
+    def fill_grid(self):
+        shape = (self.B, self.N, self.N)
+        self.digits = self.rng.integers(1, 10, size=shape, dtype=np.int8)
+
+    def fill_black(self):
+        shape = (self.B, self.N, self.N)
+        self.white = self.rng.random(shape) >= self.blackcells
+        # top row and left column are black cells
+        self.white[:, 0, :] = False
+        self.white[:, :, 0] = False
+
+    def change_isolated(self):
+        white = self.white
+        neighbour = np.zeros_like(white)
+        neighbour[:, 1:, :] |= white[:, :-1, :]
+        neighbour[:, :-1, :] |= white[:, 1:, :]
+        neighbour[:, :, 1:] |= white[:, :, :-1]
+        neighbour[:, :, :-1] |= white[:, :, 1:]
+        self.white = white & neighbour
+
+    # draw again the digits repeated in a zone, at most maxattempts times
+    # a new digit is preferably unused in both zones of the cell, else unused in one of them
+    # rows and columns are kept as lines of B*N cells, only the lines holding a changed cell are
+    # computed again, the grids already valid or with a zone too long are not touched any more
+    # returns a (B,) mask of the valid grids
+    def check_grid(self):
+        B, N = self.B, self.N
+        digits = self.digits
+        hwhite = self.white.reshape(B*N, N)
+        vwhite = np.ascontiguousarray(self.white.swapaxes(1, 2)).reshape(B*N, N)
+        hp, hrep, hlen = zone_stats(hwhite, digits.reshape(B*N, N))
+        vp, vrep, vlen = zone_stats(vwhite, np.ascontiguousarray(digits.swapaxes(1, 2)).reshape(B*N, N))
+        toolong = ((hlen > 9).reshape(B, N*N).any(axis=1)) | ((vlen > 9).reshape(B, N*N).any(axis=1))
+        active = ~toolong[:, None, None]
+
+        repeated = (hrep.reshape(B, N, N) | vrep.reshape(B, N, N).swapaxes(1, 2)) & active
+        for attempt in range(self.maxattempts):
+            b, r, c = np.nonzero(repeated)
+            if len(b) == 0:
+                break
+            hl = b*N + r
+            vl = b*N + c
+            ph = hp[hl, c]
+            pv = vp[vl, r]
+            scores = self.rng.random(ph.shape, dtype=np.float32) + 2 * ~(ph | pv) + (~ph | ~pv)
+            digits[b, r, c] = (scores.argmax(axis=1) + 1).astype(np.int8)
+            rows = np.unique(hl)
+            cols = np.unique(vl)
+            hp[rows], hrep[rows], _ = zone_stats(hwhite[rows], digits[rows // N, rows % N, :])
+            vp[cols], vrep[cols], _ = zone_stats(vwhite[cols], digits[cols // N, :, cols % N])
+            repeated = (hrep.reshape(B, N, N) | vrep.reshape(B, N, N).swapaxes(1, 2)) & active
+
+        hasrepeat = repeated.any(axis=(1, 2))
+        self.stats["grids"] += B
+        self.stats["toolong"] += int(toolong.sum())
+        self.stats["repeated"] += int(hasrepeat.sum())
+        return ~toolong & ~hasrepeat
+
+    # KakuroGrid objects of the grids selected by the mask valid, with their clues
+    # the zone index is built by the KakuroGrid when it is needed
+    def to_grids(self, valid):
+        white = self.white[valid]
+        digits = np.where(white, self.digits[valid], 0).astype(np.int8)
+        kind = np.where(white, WHITE, BLACK).astype(np.int8)
+        hclues = zone_clues(white, digits)
+        vclues = zone_clues(white.swapaxes(1, 2), digits.swapaxes(1, 2)).swapaxes(1, 2)
+        grids = []
+        for k in range(len(kind)):
+            kakuro = KakuroGrid.from_planes(self.N, kind[k].tobytes(), digits[k].tobytes(),
+                                            np.ascontiguousarray(hclues[k]).tobytes(),
+                                            np.ascontiguousarray(vclues[k]).tobytes())
+            kakuro.blackcells = self.blackcells
+            kakuro.maxattempts = self.maxattempts
+            grids.append(kakuro)
+        return grids
+
+    # generate a batch, returns the list of the valid grids as KakuroGrid
+    def fill(self):
+        self.fill_grid()
+        self.fill_black()
+        self.change_isolated()
+        valid = self.check_grid()
+        grids = self.to_grids(valid)
+        self.stats["valid"] += len(grids)
+        return grids
+
+    # returns count valid grids, generating as many batches as needed
+    def generate(self, count):
+        grids = []
+        while len(grids) < count:
+            grids.extend(self.fill())
+        return grids[:count]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare batch generation with KakuroGrid.fill()")
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=10)
+    parser.add_argument("-b","--batch",help="Grids per batch",type=int, default=512)
+    parser.add_argument("-g","--grids",help="Number of grids",type=int, default=1000)
+    parser.add_argument("--bcells",help="Black cell density",type=float, default=0.4)
+    parser.add_argument("--seed",help="Seed of the random generator",type=int)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batch = KakuroBatch(args.size, args.batch, args.bcells, seed=args.seed)
+    grids = batch.generate(args.grids)
+    elapsed = time.perf_counter() - start
+    print("batch : {} grids in {:.2f} s, {:.1f} grids/s, {}".format(len(grids), elapsed, len(grids)/elapsed, batch.stats))
+
+    start = time.perf_counter()
+    k = 0
+    while k < args.grids:
+        if KakuroGrid(args.size, maxattempts=10, bcells=args.bcells, seed=None).fill():
+            k = k + 1
+    elapsed = time.perf_counter() - start
+    print("single: {} grids in {:.2f} s, {:.1f} grids/s".format(k, elapsed, k/elapsed))
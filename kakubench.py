@@ -0,0 +1,162 @@
+from kakugrid import KakuroGrid, FillStats
+from kakusolver import make_solver, BACKENDS
+from kakulayout import draw_layout
+import argparse
+import platform
+import random
+import json
+import time
+import sys
+
+# Generation benchmark
+# for each (size, bcells, strategy) of the matrix, a fixed number of fill attempts is timed phase by phase
+# the attempts run KakuroGrid.fill() with a FillStats, the phases are those of the strategy
+# with --layouts, each attempt gets a layout from kakulayout, drawing it is timed as the "draw_layout" phase
+# results are written as JSON so that two releases can be compared with --compare
+# with --solvers, the uniqueness check of the same filled grids is timed with each solver backend instead
+
+SIZES = [8, 10, 15, 20, 25, 30]
+BCELLS = [0.2, 0.3, 0.4, 0.5]
+SOLVER_SIZES = [6, 8, 10, 14, 20]
+SOLVER_BCELLS = [0.4]
+STRATEGIES = ["repair", "construct"]
+# phases of fill() for both strategies, in the order they run
+PHASES = ["draw_layout", "fill_grid", "clear_digits", "fill_black", "change_isolated", "set_layout",
+          "build_runs", "check_grid", "construct_grid", "fill_clues"]
+
+def bench_config(size, bcells, attempts, seed, strategy="repair", layouts=False):
+    rng = random.Random(seed)
+    stats = FillStats()
+    start = time.perf_counter()
+    for _ in range(attempts):
+        layout = None
+        if layouts:
+            begin = time.perf_counter()
+            layout = draw_layout(size, bcells, rng)
+            stats.times["draw_layout"] += time.perf_counter() - begin
+            stats.calls["draw_layout"] += 1
+        kakuro = KakuroGrid(size,maxattempts=10,bcells=bcells,rng=rng,stats=stats)
+        kakuro.fill(strategy, layout)
+    elapsed = time.perf_counter() - start
+    success = stats.success
+    return {
+        "size": size,
+        "bcells": bcells,
+        "strategy": strategy,
+        "layouts": layouts,
+        "attempts": attempts,
+        "success": success,
+        "success_rate": success / attempts,
+        "elapsed": elapsed,
+        "grids_per_second": success / elapsed if elapsed else 0.0,
+        "attempts_per_second": attempts / elapsed if elapsed else 0.0,
+        # mean time per attempt of each phase, in milliseconds
+        "phase_ms": {phase: stats.times[phase] * 1000 / attempts for phase in PHASES if phase in stats.calls},
+        "failures": dict(stats.failures),
+    }
+
+# mean and max time of count_solutions(2) for each backend, in milliseconds
+# and the number of grids dlx gave up and solved again with propagation
+def bench_solvers(size, bcells, grids, seed):
+    rng = random.Random(seed)
+    puzzles = []
+    while len(puzzles) < grids:
+        kakuro = KakuroGrid(size,maxattempts=10,bcells=bcells,rng=rng)
+        if kakuro.fill():
+            puzzles.append(kakuro)
+    result = {"size": size, "bcells": bcells, "grids": grids, "solver_ms": {}}
+    for backend in BACKENDS:
+        times = []
+        fallbacks = 0
+        for kakuro in puzzles:
+            solver = make_solver(kakuro, backend)
+            solver.count_solutions(2)
+            times.append(solver.stats["time"])
+            fallbacks += solver.stats.get("fallback", 0)
+        result["solver_ms"][backend] = {"mean": sum(times) * 1000 / grids, "max": max(times) * 1000, "fallbacks": fallbacks}
+    return result
+
+def print_solvers(result, file=sys.stdout):
+    backends = "  ".join("{} {:8.2f} ms (max {:8.2f}, {} fallbacks)".format(backend, t["mean"], t["max"], t.get("fallbacks", 0))
+                         for backend, t in result["solver_ms"].items())
+    print("size {:>3} bcells {:.2f}  {}".format(result["size"], result["bcells"], backends), file=file)
+
+def run(sizes, bcells, attempts, seed, verbose=False, strategies=["repair"], layouts=False):
+    results = []
+    for size in sizes:
+        for b in bcells:
+            for strategy in strategies:
+                result = bench_config(size, b, attempts, seed, strategy, layouts)
+                results.append(result)
+                if verbose:
+                    print_result(result, file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "attempts": attempts,
+        "layouts": layouts,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+def print_result(result, file=sys.stdout):
+    phases = " ".join("{}={:.3f}".format(p, result["phase_ms"][p]) for p in PHASES if p in result["phase_ms"])
+    print("size {:>3} bcells {:.2f} {:<17} success {:6.1%}  {:8.1f} grids/s  ms/attempt: {}".format(
+        result["size"], result["bcells"], config_name(result), result["success_rate"], result["grids_per_second"], phases), file=file)
+
+# strategy of a result, "+layouts" when the layouts were drawn by kakulayout
+# reports written before the strategies were benchmarked are "repair" without layouts
+def config_name(result):
+    return result.get("strategy", "repair") + ("+layouts" if result.get("layouts") else "")
+
+# print the ratio new/old of grids/s and success rate for the configurations found in both reports
+def compare(old, new):
+    previous = {(r["size"], r["bcells"], config_name(r)): r for r in old["results"]}
+    print("size bcells strategy           grids/s old -> new (ratio)     success old -> new")
+    for r in new["results"]:
+        o = previous.get((r["size"], r["bcells"], config_name(r)))
+        if o is None:
+            continue
+        ratio = r["grids_per_second"] / o["grids_per_second"] if o["grids_per_second"] else float("inf")
+        print("{:>4} {:>6.2f} {:<17} {:8.1f} -> {:8.1f} ({:5.2f}x)   {:6.1%} -> {:6.1%}".format(
+            r["size"], r["bcells"], config_name(r), o["grids_per_second"], r["grids_per_second"], ratio,
+            o["success_rate"], r["success_rate"]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark kakuro grid generation")
+    parser.add_argument("-s","--sizes",help="Grid sizes",nargs='+', type=int)
+    parser.add_argument("-b","--bcells",help="Black cell densities",nargs='+', type=float)
+    parser.add_argument("-a","--attempts",help="Fill attempts per configuration",type=int, default=200)
+    parser.add_argument("--seed",help="Seed of the random generator",type=int, default=0)
+    parser.add_argument("-o","--output",help="JSON file where results are written")
+    parser.add_argument("-c","--compare",help="JSON results of a previous run to compare with")
+    parser.add_argument("--strategy",help="fill strategies to benchmark",nargs='+',choices=STRATEGIES,default=["repair"])
+    parser.add_argument("-l","--layouts",action='store_true',help="fill valid black cells layouts drawn by kakulayout")
+    parser.add_argument("--solvers",action='store_true',help="time the solver backends, attempts grids per configuration")
+    parser.add_argument("-v","--verbose",action='store_true',help="print each configuration as it completes")
+    args = parser.parse_args()
+
+    if args.solvers:
+        results = []
+        for size in args.sizes or SOLVER_SIZES:
+            for b in args.bcells or SOLVER_BCELLS:
+                results.append(bench_solvers(size, b, args.attempts, args.seed))
+                print_solvers(results[-1])
+        if args.output:
+            with open(args.output,"w") as f:
+                json.dump({"seed": args.seed, "solvers": results}, f, indent=2)
+        sys.exit(0)
+
+    report = run(args.sizes or SIZES, args.bcells or BCELLS, args.attempts, args.seed, args.verbose, args.strategy, args.layouts)
+
+    if args.output:
+        with open(args.output,"w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        for result in report["results"]:
+            print_result(result)
+
+    if args.compare:
+        with open(args.compare,"r") as f:
+            compare(json.load(f), report)
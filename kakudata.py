@@ -1,29 +1,107 @@
 import itertools
 import collections
+from array import array
 from functools import reduce
 from typing import List
 
+# Digit combinations of the kakuro zones
+# digit d is bit (d-1) of a mask, a zone of length 2 to 9 with a sum up to 45
+# is identified by key = sum*10 + length
+# all the tables are flat arrays computed once when the module is imported
+MAXSUM = 45
+NKEYS = (MAXSUM+1) * 10
+
 class KakuroData:
-    def def __init__(self):
+    def __init__(self):
+        # "1245" -> sum
         self.factors = {}
+        # length -> sorted list of the possible sums
         self.sum_by_len = {}
+        # sum -> sorted list of the possible lengths
         self.len_by_sum = {}
+        # sum -> list of all the combinations e.g. 12 -> ["39", "48", "57", "129", ...]
         self.factors_by_sum = {}
+        # (sum, length) -> list of digit masks
+        self.combinations = collections.defaultdict(list)
+
+        # masks of the combinations of key are combos[first[key]:first[key+1]]
+        self.combos = array('H')
+        self.first = array('H', bytes(2*(NKEYS+1)))
+        # digits used by at least one / by all the combinations of key
+        self.union = array('H', bytes(2*NKEYS))
+        self.inter = array('H', bytes(2*NKEYS))
+        # allowed[key*512 + placed] : digits of the combinations of key containing all the digits of placed
+        # 0 if there is no such combination
+        self.allowed = array('H', bytes(2*NKEYS*512))
 
+        self.find_combinations()
 
     def find_combinations(self):
         # we get all the possible combinations that have 2 to 9 factors
         numbers = [1, 2, 3, 4, 5, 6, 7, 8, 9]
 
+        sum_by_len = collections.defaultdict(set)
+        len_by_sum = collections.defaultdict(set)
+        self.factors_by_sum = collections.defaultdict(list)
         for length in range(2, 10):
             for combination in itertools.combinations(numbers, length):
                 total_sum = sum(combination)
                 factors_str = "".join(map(str, combination))
-                self.len_by_sum[total_sum] = length
-                self.factors_by_sum[total_sum] = factors_str
+                self.factors[factors_str] = total_sum
+                sum_by_len[length].add(total_sum)
+                len_by_sum[total_sum].add(length)
+                self.factors_by_sum[total_sum].append(factors_str)
+                mask = reduce(lambda m, d: m | 1 << (d-1), combination, 0)
+                self.combinations[(total_sum, length)].append(mask)
+        self.sum_by_len = {length: sorted(sums) for length, sums in sum_by_len.items()}
+        self.len_by_sum = {total: sorted(lengths) for total, lengths in len_by_sum.items()}
+
+        for key in range(NKEYS):
+            self.first[key] = len(self.combos)
+            masks = self.combinations.get((key // 10, key % 10), [])
+            self.combos.extend(masks)
+            if not masks:
+                continue
+            self.union[key] = reduce(lambda a, b: a | b, masks)
+            self.inter[key] = reduce(lambda a, b: a & b, masks)
+            # every subset of a combination can be the set of the digits already placed
+            base = key * 512
+            for mask in masks:
+                placed = mask
+                while True:
+                    self.allowed[base + placed] |= mask
+                    if placed == 0:
+                        break
+                    placed = (placed - 1) & mask
+        self.first[NKEYS] = len(self.combos)
+
+    def key(self, total, length):
+        if total < 0 or total > MAXSUM or length < 0 or length > 9:
+            return -1
+        return total*10 + length
+
+    # list of the masks of the combinations of a zone
+    def get_combinations(self, total, length):
+        key = self.key(total, length)
+        if key < 0:
+            return []
+        return self.combos[self.first[key]:self.first[key+1]].tolist()
+
+    # digits used by at least one combination of a zone
+    def union_mask(self, total, length):
+        key = self.key(total, length)
+        return self.union[key] if key >= 0 else 0
 
-                
+    # digits used by all the combinations of a zone
+    def inter_mask(self, total, length):
+        key = self.key(total, length)
+        return self.inter[key] if key >= 0 else 0
 
-        
-KakuroData.find_combinations()
+    # digits allowed in a zone where the digits of mask placed are already used
+    # the placed digits are included, 0 if no combination contains all of them
+    def allowed_digits(self, total, length, placed=0):
+        key = self.key(total, length)
+        return self.allowed[key*512 + placed] if key >= 0 else 0
 
+# shared tables, computed once at import
+DATA = KakuroData()
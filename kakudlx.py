@@ -0,0 +1,232 @@
+from kakugrid import KakuroGrid
+from kakusolver import KakuroSolver, Restart, supports
+import random
+import time
+import sys
+
+# Exact cover solver using Dancing Links (algorithm X)
+#
+# columns, each one covered exactly once
+#  - cell c       : the white cell c gets one digit
+#  - zone z       : the zone z gets one combination of KakuroData
+#  - digit (z, d) : digit d of zone z, covered by the cell of z holding d
+#                   or by the combination of z when d is not in it
+# rows
+#  - (c, d)       : cell c holds digit d, covers c, (hrun, d) and (vrun, d)
+#  - (z, combo)   : zone z uses combo, covers z and (z, d) for each digit d of the zone not in combo
+# with a combination of n digits in a zone of n cells, each digit of the combination is held by exactly one cell
+#
+# the rows are built from the candidates left by a first propagation, see KakuroSolver.propagate()
+# the search always covers the column with the fewest rows, ties are broken at random
+# like KakuroSolver, the search restarts with a larger node budget when it gets lost,
+# the matrix is built again for each restart
+# the restarts do not remove the heavy tail: a few grids need millions of nodes where propagation needs
+# a few hundred, after MAX_NODES nodes the grid is solved again by KakuroSolver and stats["fallback"] is 1
+class DLXSolver(KakuroSolver):
+    RESTART_NODES = 1000
+    RESTART_GROWTH = 1.5
+    MAX_NODES = 20000
+
+    # build the links of the exact cover matrix for the candidates cand
+    # returns False if a column cannot be covered
+    def build(self, cand):
+        runs = self.runs
+        columns = {}
+        def column(key):
+            if key not in columns:
+                columns[key] = len(columns) + 1
+            return columns[key]
+
+        rows = []
+        # zones with the combinations compatible with the candidates
+        for run, cells in enumerate(runs):
+            valid = [combo for combo in self.combos[run]
+                     if supports(tuple([cand[i] & combo for i in cells])) is not None]
+            union = 0
+            for combo in valid:
+                union |= combo
+            for combo in valid:
+                cols = [column(("z", run))]
+                cols += [column(("d", run, d)) for d in range(1, 10) if union >> (d-1) & 1 and not combo >> (d-1) & 1]
+                rows.append((cols, None))
+            if not valid:
+                return False
+        for i in self.cells:
+            for d in range(1, 10):
+                if cand[i] >> (d-1) & 1:
+                    cols = [column(("c", i))]
+                    cols += [column(("d", run, d)) for run in (self.hrun[i], self.vrun[i]) if run >= 0]
+                    rows.append((cols, (i, d)))
+
+        # node 0 is the root, nodes 1..ncols are the column headers
+        ncols = len(columns)
+        self.L = list(range(-1, ncols))
+        self.L[0] = ncols
+        self.R = list(range(1, ncols + 2))
+        self.R[ncols] = 0
+        self.U = list(range(ncols + 1))
+        self.D = list(range(ncols + 1))
+        self.C = list(range(ncols + 1))
+        self.S = [0] * (ncols + 1)
+        # (cell, digit) of the row of each node, None for a zone row
+        self.rowinfo = [None] * (ncols + 1)
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        for cols, info in rows:
+            first = len(C)
+            for k, col in enumerate(cols):
+                node = len(C)
+                C.append(col)
+                self.rowinfo.append(info)
+                # insert at the bottom of the column
+                U.append(U[col])
+                D.append(col)
+                D[U[col]] = node
+                U[col] = node
+                S[col] += 1
+                # insert in the row
+                L.append(node - 1 if k else node)
+                R.append(first)
+                if k:
+                    R[node - 1] = node
+                    L[first] = node
+        return True
+
+    def cover(self, col):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[col]] = R[col]
+        L[R[col]] = L[col]
+        i = D[col]
+        while i != col:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, col):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[col]
+        while i != col:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[col]] = col
+        L[R[col]] = col
+
+    # algorithm X, calls found(rows) for each exact cover, stops when found returns True
+    def search(self, chosen, found):
+        R, D, S = self.R, self.D, self.S
+        self.stats["nodes"] += 1
+        if self.stats["nodes"] > self.budget:
+            raise Restart()
+        if R[0] == 0:
+            return found(chosen)
+        # column with the fewest rows
+        rnd = self.rnd.random
+        col = R[0]
+        best = col
+        ties = 1
+        while col != 0:
+            size = S[col]
+            if size < S[best]:
+                best = col
+                ties = 1
+                if size <= 1:
+                    break
+            elif size == S[best]:
+                ties += 1
+                if rnd() * ties < 1:
+                    best = col
+            col = R[col]
+        if S[best] == 0:
+            self.stats["backtracks"] += 1
+            return False
+        self.cover(best)
+        i = D[best]
+        while i != best:
+            chosen.append(i)
+            j = self.R[i]
+            while j != i:
+                self.cover(self.C[j])
+                j = self.R[j]
+            done = self.search(chosen, found)
+            j = self.L[i]
+            while j != i:
+                self.uncover(self.C[j])
+                j = self.L[j]
+            chosen.pop()
+            if done:
+                self.uncover(best)
+                return True
+            i = D[i]
+        self.uncover(best)
+        return False
+
+    def reset_stats(self):
+        KakuroSolver.reset_stats(self)
+        self.stats["fallback"] = 0
+
+    # same interface as KakuroSolver.run(), returns the solutions as candidate lists
+    def run(self, limit, cand=None):
+        self.reset_stats()
+        self.weight = [1] * len(self.runs)
+        self.rnd = random.Random(self.seed)
+        start = time.perf_counter()
+        initial = cand
+        cand = self.start() if cand is None else list(cand)
+        solutions = {}
+        def found(chosen):
+            solution = list(cand)
+            for node in chosen:
+                info = self.rowinfo[node]
+                if info is not None:
+                    i, d = info
+                    solution[i] = 1 << (d-1)
+            solutions[tuple(solution)] = True
+            self.stats["solutions"] = len(solutions)
+            return len(solutions) >= limit
+        if self.propagate(cand, range(len(self.runs))):
+            # one level of recursion per row of the cover
+            depth = len(self.cells) + len(self.runs) + 100
+            if sys.getrecursionlimit() < depth:
+                sys.setrecursionlimit(depth)
+            nodes = self.RESTART_NODES
+            while self.build(cand):
+                if self.stats["nodes"] >= self.MAX_NODES:
+                    return self.fallback(limit, initial, start)
+                self.budget = self.stats["nodes"] + nodes
+                try:
+                    self.search([], found)
+                    break
+                except Restart:
+                    self.stats["restarts"] += 1
+                    nodes = int(nodes * self.RESTART_GROWTH)
+        self.stats["time"] = time.perf_counter() - start
+        return [list(solution) for solution in solutions]
+
+    # solve with KakuroSolver, the nodes of both searches are counted
+    def fallback(self, limit, cand, start):
+        solver = KakuroSolver(self.kakuro, self.seed)
+        solutions = solver.run(limit, cand)
+        for key in ("nodes", "backtracks", "propagations", "restarts"):
+            self.stats[key] += solver.stats[key]
+        self.stats["solutions"] = solver.stats["solutions"]
+        self.stats["fallback"] = 1
+        self.stats["time"] = time.perf_counter() - start
+        return solutions
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    kakuro = KakuroGrid(size,maxattempts=10,bcells=0.4)
+    while not kakuro.fill():
+        kakuro = KakuroGrid(size,maxattempts=10,bcells=0.4)
+    for solver in (KakuroSolver(kakuro), DLXSolver(kakuro)):
+        solution, stats = solver.solve()
+        print(type(solver).__name__, "no solution" if solution is None else "solved", stats)
+        print(type(solver).__name__, "unique" if solver.is_unique() else "several solutions", solver.stats)
@@ -1,6 +1,11 @@
 from kakugrid import KakuroGrid
 import os
 import glob
+try:
+    import fcntl
+except ImportError:
+    # no file locking available (Windows), IDs are only safe within a single process
+    fcntl = None
 
 class FileGrid():
     def __init__(self,griddir="grids") -> None:
@@ -12,10 +17,23 @@ class FileGrid():
         if self.griddir and not os.path.exists(self.griddir):
             os.makedirs(self.griddir)
         self.gridpath = ""        
+        # last grid ID given, shared by all the processes writing in griddir
+        self.counterfile = os.path.join(self.griddir,".gridid")
+        # one line "ID filename" per grid
+        self.indexfile = os.path.join(self.griddir,".gridindex")
+        # ID -> filename, loaded from indexfile when needed
+        self.index = None
+        # one line per grid, hash of its canonical problem, see KakuroGrid.problem_hash()
+        self.hashfile = os.path.join(self.griddir,".gridhashes")
+        # hashes read from hashfile, and how far hashfile has been read
+        self.hashes = None
+        self.hashoffset = 0
 
     def createNewFile(self):
         gid = self.createGridID()
-        self.gridpath = os.path.abspath(self.griddir+"/"+self.prefix+gid+ self.gridext)
+        filename = self.prefix+gid+ self.gridext
+        self.gridpath = os.path.abspath(self.griddir+"/"+filename)
+        self.addToIndex(gid,filename)
         return self.gridpath
 
     def getGridPath(self):
@@ -24,52 +42,247 @@ class FileGrid():
     def getExtension(self):
         return self.gridext
         
-    def getGrid(self,puzzleid):
+    # returns the KakuroGrid of a puzzle
+    #  - puzzleid : grid ID e.g. "45" or path of the problem
+    #  - solution : also load the digits from the .sol file next to the problem
+    def getGrid(self,puzzleid,solution=False):
         if puzzleid.isdigit():
-            pid = str(puzzleid)
-            while len(pid) < self.GID_SIZE:
-                pid = "0"+pid
-            
-            items = os.listdir(self.griddir)
-            filename = ""
-            for f in items:
-                if f.endswith(str(pid)+self.gridext):
-                    filename = f
-                    break
+            pid = self.padID(int(puzzleid))
+            filename = self.findGrid(pid)
             if not filename:
                 raise Exception("Cannot find grid ", pid)
-            # remove extension and store filename
-            #self.filename = filename[:-4]
             filepath = os.path.join(self.griddir+"/",filename)
         else:
             filepath = puzzleid
 
         self.gridpath = filepath        
-        return KakuroGrid(fpath=filepath)
+        return KakuroGrid(fpath=filepath,solpath=self.getSolutionPath(filepath) if solution else None)
+
+    # path of the .sol file of a problem
+    def getSolutionPath(self,gridpath):
+        return gridpath[:-len(self.gridext)] + ".sol"
+
+    # load the grids of griddir one by one
+    # yields (grid ID, KakuroGrid), only one grid is in memory at a time
+    # the directory is read lazily, grids come in directory order
+    #  - solution : also load the digits of each grid from its .sol file
+    def iter_grids(self,solution=False):
+        with os.scandir(self.griddir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.gridext) or not entry.is_file():
+                    continue
+                solpath = None
+                if solution:
+                    solpath = self.getSolutionPath(entry.path)
+                    if not os.path.exists(solpath):
+                        solpath = None
+                yield self.getGridID(entry.path), KakuroGrid(fpath=entry.path,solpath=solpath)
+
+    # returns the grid ID as a string padded with 0, e.g. 45 -> "0045"
+    def padID(self,gid):
+        gid = str(gid)
+        while len(gid) < self.GID_SIZE:
+            gid = "0" + gid
+        return gid
+
+    # lock a file opened by this process, the lock is released when the file is closed
+    def lock(self,f):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(),fcntl.LOCK_EX)
 
     # Generate a new GRID ID that is unique
     # returns a string 
     #         e.g. "0045"
+    # the last ID is stored in counterfile, the file is locked while it is incremented
+    # so that several processes generating grids in the same directory never get the same ID
     def createGridID(self):
-       
-        # grid ID is a 4 digit numbers e.g. 0012 
+        return self.padID(self.createGridIDs(1))
+
+    # reserve count consecutive IDs with a single update of counterfile
+    # returns the first ID as an int
+    def createGridIDs(self,count):
         if self.griddir and not os.path.exists(self.griddir):
             os.makedirs(self.griddir)
-        items = os.listdir(self.griddir)
-        items.sort(reverse=True)
-        if items:
-            # end contains gid + extension (either .sol or .clp)
-            #endlen = self.GID_SIZE+len(self.gridext)
-            gidstart = len(self.prefix)
-            gid = items[0][gidstart:gidstart+self.GID_SIZE]
-            lastgid = int(gid)
-        else:
-            lastgid = 0
-        gid = str(lastgid +1)
-        # pad with 0
-        while len(gid) < self.GID_SIZE:
-            gid = "0" + gid
-        return gid
+        fd = os.open(self.counterfile,os.O_RDWR | os.O_CREAT)
+        with os.fdopen(fd,"r+") as f:
+            self.lock(f)
+            content = f.read().strip()
+            if content:
+                lastgid = int(content)
+            else:
+                # first ID given in this directory, start after the existing grids
+                lastgid = self.scanLastID()
+            f.seek(0)
+            f.truncate()
+            f.write(str(lastgid+count))
+            f.flush()
+        return lastgid +1
+
+    # highest grid ID found in griddir, 0 if there is none
+    def scanLastID(self):
+        lastgid = 0
+        for item in os.listdir(self.griddir):
+            gid = self.parseID(item)
+            if gid:
+                lastgid = max(lastgid,int(gid))
+        return lastgid
+
+    # ID of a grid file, all the digits between the prefix and the extension
+    # e.g. "k-0045.clp" -> "0045", "k-10000.clp" -> "10000", "" if the name is not a grid ID
+    def parseID(self,filename):
+        name = os.path.basename(filename)
+        if not name.startswith(self.prefix) or not name.endswith(self.gridext):
+            return ""
+        gid = name[len(self.prefix):len(name)-len(self.gridext)]
+        return gid if gid.isdigit() else ""
+
+    def addToIndex(self,gid,filename):
+        if not os.path.exists(self.indexfile):
+            self.rebuildIndex()
+        with open(self.indexfile,"a") as f:
+            self.lock(f)
+            f.write(gid+" "+filename+"\n")
+        if self.index is not None:
+            self.index[gid] = filename
+
+    # read the ID -> filename index
+    # the index is built from the directory content the first time
+    def loadIndex(self):
+        if not os.path.exists(self.indexfile):
+            self.rebuildIndex()
+        self.index = {}
+        with open(self.indexfile,"r") as f:
+            for line in f:
+                vals = line.split()
+                if len(vals) == 2:
+                    self.index[vals[0]] = vals[1]
+
+    def rebuildIndex(self):
+        lines = []
+        for path in self.getAllGrids():
+            gid = self.getGridID(path)
+            if gid.isdigit():
+                lines.append(gid+" "+os.path.basename(path)+"\n")
+        with open(self.indexfile,"a") as f:
+            self.lock(f)
+            # another process may have built it meanwhile
+            if os.fstat(f.fileno()).st_size == 0:
+                f.writelines(lines)
+
+    # register the hash of a new problem, before writing it
+    # returns False if the problem, or its transpose, is already in griddir
+    # the hash file is locked, two processes cannot both register the same problem
+    def registerHash(self,phash):
+        if not os.path.exists(self.hashfile):
+            self.rebuildHashes()
+        with open(self.hashfile,"a+") as f:
+            self.lock(f)
+            self.readHashes(f)
+            if phash in self.hashes:
+                return False
+            f.write(phash+"\n")
+            f.flush()
+            self.hashoffset = f.tell()
+        self.hashes.add(phash)
+        return True
+
+    # register the hashes of several new problems with a single lock of the hash file
+    # returns the hashes registered, the ones already in griddir, or twice in phashes, are left out
+    def registerHashes(self,phashes):
+        if not os.path.exists(self.hashfile):
+            self.rebuildHashes()
+        registered = []
+        with open(self.hashfile,"a+") as f:
+            self.lock(f)
+            self.readHashes(f)
+            for phash in phashes:
+                if phash not in self.hashes:
+                    self.hashes.add(phash)
+                    registered.append(phash)
+            f.write("".join(phash+"\n" for phash in registered))
+            f.flush()
+            self.hashoffset = f.tell()
+        return registered
+
+    # True if the problem, or its transpose, is already in griddir, nothing is registered
+    def hasHash(self,phash):
+        if not os.path.exists(self.hashfile):
+            self.rebuildHashes()
+        with open(self.hashfile,"r") as f:
+            self.readHashes(f)
+        return phash in self.hashes
+
+    # read the hashes added to hashfile since the last read, e.g. by another process
+    def readHashes(self,f):
+        if self.hashes is None:
+            self.hashes = set()
+            self.hashoffset = 0
+        f.seek(self.hashoffset)
+        for line in f:
+            line = line.strip()
+            if line:
+                self.hashes.add(line)
+        self.hashoffset = f.tell()
+
+    # hashes of the problems already in griddir, written the first time the index is used
+    def rebuildHashes(self):
+        lines = []
+        for path in self.getAllGrids():
+            lines.append(KakuroGrid(fpath=path).problem_hash()+"\n")
+        with open(self.hashfile,"a") as f:
+            self.lock(f)
+            if os.fstat(f.fileno()).st_size == 0:
+                f.writelines(lines)
+
+    # returns the filename of the grid with ID pid e.g. "0045", "" if not found
+    def findGrid(self,pid):
+        if self.index is None or pid not in self.index:
+            # the grid may have been added by another process
+            self.loadIndex()
+        filename = self.index.get(pid,"")
+        if not filename:
+            # grid added without the index, look for it in the directory
+            for f in os.listdir(self.griddir):
+                if self.parseID(f) == pid:
+                    filename = f
+                    self.addToIndex(pid,filename)
+                    break
+        return filename
+
+    # write the problems and solutions of grids with the IDs first, first+1, ... given by createGridIDs()
+    # the index and the hash file are updated with one write each, the hashes are not checked again
+    #  - registered : the hashes were already added with registerHashes(), the hash file is not written
+    # writing the same grids with the same IDs again gives the same files
+    # returns the paths of the problems
+    def writeGrids(self,first,kakuros,registered=False):
+        if not os.path.exists(self.indexfile):
+            self.rebuildIndex()
+        if not os.path.exists(self.hashfile):
+            self.rebuildHashes()
+        paths = []
+        entries = []
+        hashes = []
+        for k, kakuro in enumerate(kakuros):
+            gid = self.padID(first+k)
+            filename = self.prefix+gid+self.gridext
+            self.gridpath = os.path.abspath(self.griddir+"/"+filename)
+            self.write(kakuro.serialize_problem())
+            self.writeSolution(kakuro.serialize_solution())
+            paths.append(self.gridpath)
+            entries.append(gid+" "+filename+"\n")
+            hashes.append(kakuro.problem_hash())
+            if self.index is not None:
+                self.index[gid] = filename
+        with open(self.indexfile,"a") as f:
+            self.lock(f)
+            f.writelines(entries)
+        if not registered:
+            with open(self.hashfile,"a") as f:
+                self.lock(f)
+                f.writelines(phash+"\n" for phash in hashes)
+            if self.hashes is not None:
+                self.hashes.update(hashes)
+        return paths
 
     def getAllGrids(self):
         path =  self.griddir+"/*"+ self.gridext
@@ -77,6 +290,9 @@ class FileGrid():
         return files
 
     def getGridID(self,gridpath):
+        gid = self.parseID(gridpath)
+        if gid:
+            return gid
         # get filename without extension
         extlen = len(self.gridext)
         gridname = os.path.basename(gridpath)[:-extlen]
@@ -1,7 +1,101 @@
 from os import getpid
-from kakugrid import KakuroGrid
+from kakugrid import KakuroGrid, FillStats
 from kakufile import FileGrid
+from kakusolver import make_solver, BACKENDS
+from kakumutate import UniqueImprover
+from kakuarchive import GridArchive
+from kakujournal import GridJournal
+from kakulayout import LayoutPool
+from kakurate import KakuroRater, LEVELS, TECHNIQUES
+import multiprocessing
+import collections
+import itertools
+import os
 import argparse
+import random
+import time
+
+# number of grids appended at once to an archive
+ARCHIVE_BATCH = 1000
+# layouts kept by the LayoutPool of a task, each one is given LayoutPool.reuse times
+# with a larger pool, a task that needs a few attempts, e.g. with -u, would draw a new layout for each one
+LAYOUT_POOL = 2
+# duplicates in a row after which a run stops, e.g. when small grids have few distinct problems
+DUPLICATE_LIMIT = 1000
+
+# task of generate_grid(), the fields not given take their default value
+GridTask = collections.namedtuple("GridTask",
+    ["size", "bcells", "unique", "verbose", "seed", "rate", "levels", "strategy", "layouts", "symmetric", "withstats", "backend", "improve"],
+    defaults=[0.4, False, False, None, False, None, "repair", False, False, False, "auto", False])
+
+# generate one grid, try again until fill() succeeds
+# task is a GridTask
+#  - seed   : seed of the random generator used for this grid, None to seed from the OS
+#             each task has its own generator so that workers never share a random state
+#  - rate   : rate the difficulty of the grid
+#  - levels : only keep grids of these difficulty levels, None to keep all of them
+#  - strategy : fill strategy, see KakuroGrid.fill(), construct implies layouts
+#  - layouts  : take valid black cells layouts from a LayoutPool of the task, see kakulayout
+#               the pool draws its layouts from the grid generator, a seeded task stays reproducible
+#  - symmetric : the layouts have a rotational symmetry
+#  - withstats : collect the generation statistics
+#  - backend   : solver used for the uniqueness check, see make_solver()
+#  - improve   : a grid with several solutions is changed by UniqueImprover instead of being dropped
+# returns (kakuro, uniquetimes, rating, stats)
+#  - uniquetimes : duration of the uniqueness checks done for this grid, the last one is the accepted grid
+#  - rating      : (score, hardest, counts) given by KakuroRater.rate(), None if the grid is not rated
+#  - stats       : FillStats of all the attempts made for this grid, None without withstats
+def generate_grid(task):
+    size, bcells, unique, verbose, seed, rate, levels, strategy, layouts, symmetric, withstats, backend, improve = task
+    rng = random.Random(seed)
+    uniquetimes = list()
+    stats = FillStats() if withstats else None
+    # construct cannot split the long zones of random black cells, it always fills valid layouts
+    layoutpool = LayoutPool(LAYOUT_POOL,symmetric=symmetric,rng=rng) if layouts or symmetric or strategy == "construct" else None
+    while True:
+        layout = layoutpool.get(size,bcells) if layoutpool is not None else None
+        kakuro = KakuroGrid(size,maxattempts=10,bcells=bcells,rng=rng,stats=stats)
+
+        if not kakuro.fill(strategy,layout):
+            print("KO")
+            continue
+        if unique:
+            solver = make_solver(kakuro,backend)
+            isunique = solver.is_unique()
+            uniquetimes.append(solver.stats["time"])
+            if stats is not None:
+                stats.times["uniqueness"] += solver.stats["time"]
+                stats.calls["uniqueness"] += 1
+            if verbose:
+                print("uniqueness check {:.1f} ms".format(solver.stats["time"]*1000))
+            if not isunique and improve:
+                improver = UniqueImprover(kakuro,backend=backend,rng=rng)
+                isunique = improver.improve()
+                if stats is not None:
+                    stats.times["improve"] += improver.stats["time"]
+                    stats.calls["improve"] += 1
+                    stats.counters["improved" if isunique else "improve failed"] += 1
+                if verbose:
+                    print("improve {} in {} steps".format("OK" if isunique else "KO", improver.stats["steps"]))
+            if not isunique:
+                print("not unique")
+                if stats is not None:
+                    stats.counters["rejected not unique"] += 1
+                continue
+        rating = None
+        if rate or levels:
+            start = time.perf_counter()
+            rating = KakuroRater(kakuro).rate()
+            if stats is not None:
+                stats.times["rating"] += time.perf_counter() - start
+                stats.calls["rating"] += 1
+            if levels and (rating[1] < 0 or LEVELS[rating[1]] not in levels):
+                if verbose:
+                    print("difficulty score {} rejected".format(rating[0]))
+                if stats is not None:
+                    stats.counters["rejected difficulty"] += 1
+                continue
+        return kakuro, uniquetimes, rating, stats
 
 if __name__ == '__main__':
 
@@ -12,6 +106,22 @@ if __name__ == '__main__':
     parser.add_argument("-s","--size",help="Grid size",nargs='?', type=int, default=10)
     parser.add_argument("-g","--grids",help="Number of Grid",nargs='?', const=1, type=int, default=1)
     parser.add_argument("-d","--directory",help="directory where puzzles are located")
+    parser.add_argument("-u","--unique",action='store_true',help="only keep puzzles with a unique solution")
+    parser.add_argument("-j","--jobs",help="Number of worker processes",nargs='?', type=int, default=1)
+    parser.add_argument("--seed",help="Seed of the random generator, to reproduce a run",type=int)
+    parser.add_argument("-a","--archive",help="append the puzzles to this packed archive instead of writing .clp files")
+    parser.add_argument("--journal",action='store_true',help="log the puzzles to a journal in the directory, the files are written at the end of the run")
+    parser.add_argument("--group",help="puzzles written to the journal at once",type=int, default=100)
+    parser.add_argument("--resume",action='store_true',help="continue the run stopped with this journal, implies --journal")
+    parser.add_argument("--strategy",help="fill strategy, construct scales better to large grids and implies --layouts",choices=["repair","construct"],default="repair")
+    parser.add_argument("-l","--layouts",action='store_true',help="take valid black cells layouts from a pool")
+    parser.add_argument("--symmetric",action='store_true',help="layouts with a rotational symmetry, implies --layouts")
+    parser.add_argument("--solver",help="solver of the uniqueness check, auto is propagation",choices=["auto"]+BACKENDS,default="auto")
+    parser.add_argument("--improve",action='store_true',help="with -u, change grids with several solutions until they are unique instead of dropping them")
+    parser.add_argument("--stats",action='store_true',help="show time per phase, attempts per grid and failure reasons")
+    parser.add_argument("-r","--rate",action='store_true',help="rate the difficulty of the puzzles")
+    parser.add_argument("--difficulty",help="only keep puzzles of these difficulty levels, needs -u",nargs='+',choices=LEVELS)
+    parser.add_argument("--bucket",action='store_true',help="write the puzzles in one sub-directory per difficulty level, needs -u")
     
     args = parser.parse_args()
 
@@ -30,21 +140,172 @@ if __name__ == '__main__':
     config = list()
     with open("kakuro-config.clp","r") as f:
         config = f.readlines()
+    configstart = len(config)
+
+    # time spent checking the uniqueness of each filled grid
+    uniquetimes = list()
+    rejected = 0
+
+    # only a puzzle with a unique solution has a difficulty, see KakuroRater.rate()
+    if (args.difficulty or args.bucket) and not args.unique:
+        raise Exception("--difficulty and --bucket need -u ", args.difficulty or "--bucket")
+
+    # with a journal the puzzles are only logged by the loop, written at the end by materialise()
+    # a resumed run skips the tasks already consumed, a seeded run gives the same puzzles as without the stop
+    journal = None
+    skip = 0
+    if args.journal or args.resume:
+        if args.archive:
+            raise Exception("A journal cannot be used with an archive ", args.archive)
+        journal = GridJournal(os.path.join(dir,".gridjournal"),args.group)
+        if journal.count and not args.resume:
+            raise Exception("Journal of a stopped run found, use --resume ", journal.path)
+        if journal.truncated:
+            print("{} bytes of an incomplete group removed from the journal".format(journal.truncated))
+        if args.resume:
+            skip = journal.tasks
+            print("resuming after {} grids, {} tasks".format(journal.count,skip))
+
+    # one seed per task, derived from --seed
+    # the same seed gives the same grids whatever the number of jobs, layouts are drawn by the workers from the task seed
+    master = random.Random(args.seed) if args.seed is not None else None
+    bcells = 0.4
+    rate = args.rate or args.bucket
+    # endless stream of tasks, a duplicate grid is replaced by the grid of the next task
+    def task_stream():
+        while True:
+            seed = master.getrandbits(64) if master is not None else None
+            yield GridTask(size, bcells, args.unique, args.verbose, seed, rate, args.difficulty, args.strategy, args.layouts, args.symmetric, args.stats, args.solver, args.improve)
+    tasks = task_stream()
+    for _ in range(skip):
+        next(tasks)
+    # with --bucket, one FileGrid per difficulty level in a sub-directory of dir
+    buckets = dict()
+
+    start = time.perf_counter()
+    pool = None
+    if args.jobs > 1:
+        # workers only fill grids, files and grid IDs are handled here so that IDs stay in order
+        pool = multiprocessing.Pool(args.jobs)
 
-    while k < grids:
-        kakuro = KakuroGrid(size,maxattempts=10,bcells=0.4)
-        
-        if kakuro.fill():
-            gridpath = filegrid.createNewFile()
+    # with an archive, grids are appended by batches of ARCHIVE_BATCH
+    archive = GridArchive(args.archive) if args.archive else None
+    pending = list()
+
+    # statistics of all the workers
+    fillstats = FillStats()
+    # problems already written, transposed problems are the same problem
+    # files are checked with the hash index of their directory, archives only within this run
+    seen = set()
+    duplicates = 0
+    # results taken from the workers, kept in the journal
+    consumed = skip
+    # grids still to write, a resumed run counts the grids of the journal
+    wanted = grids - (journal.count if args.resume else 0)
+    # consumed when the last grid was kept, the run stops after DUPLICATE_LIMIT duplicates in a row
+    kept = k
+    lastnew = consumed
+    while k < wanted and consumed - lastnew < DUPLICATE_LIMIT:
+        # one task per missing grid, the tasks of the duplicates are replaced in the next round
+        batch = list(itertools.islice(tasks, wanted - k))
+        if pool is None:
+            results = map(generate_grid, batch)
+        elif args.seed is None:
+            results = pool.imap_unordered(generate_grid, batch)
+        else:
+            # keep the order of the tasks so that a seeded run is reproducible
+            results = pool.imap(generate_grid, batch)
+        for kakuro, times, rating, stats in results:
+            if k > kept:
+                kept = k
+                lastnew = consumed
+            consumed = consumed + 1
+            if stats is not None:
+                fillstats.merge(stats)
+            uniquetimes.extend(times)
+            rejected = rejected + max(len(times)-1,0)
+            phash = kakuro.problem_hash()
+            if archive is not None:
+                if phash in seen:
+                    duplicates = duplicates + 1
+                    print("duplicate " + phash)
+                    continue
+                seen.add(phash)
+                k = k +1
+                pending.append(kakuro)
+                if len(pending) >= ARCHIVE_BATCH:
+                    ids = archive.append(pending)
+                    print("grids {} to {} added to {}".format(ids[0],ids[-1],args.archive))
+                    pending = list()
+                continue
+            target = filegrid
+            if rating is not None and rating[1] < 0:
+                # only with -r alone, a grid with several solutions has no difficulty
+                print("difficulty not rateable, several solutions")
+            elif rating is not None:
+                level = LEVELS[rating[1]]
+                print("difficulty {} score {} hardest technique {}".format(level,rating[0],TECHNIQUES[rating[1]]))
+                if args.bucket:
+                    if level not in buckets:
+                        buckets[level] = FileGrid(griddir=dir + "/" + level)
+                    target = buckets[level]
+            if journal is not None:
+                if phash in journal.hashes or target.hasHash(phash):
+                    duplicates = duplicates + 1
+                    print("duplicate " + phash)
+                    continue
+                k = k +1
+                journal.add(kakuro,LEVELS.index(level) if args.bucket else None,consumed)
+                print("grid {} journaled".format(journal.count + len(journal.pending)))
+                continue
+            if not target.registerHash(phash):
+                duplicates = duplicates + 1
+                print("duplicate " + phash)
+                continue
+            k = k +1
+            gridpath = target.createNewFile()
             config.append(f"(batch {gridpath})\n")
-            problem = kakuro.serialize_problem()
-            solution = kakuro.serialize_solution()
-            filegrid.write(problem)
-            filegrid.writeSolution(solution)
+            target.write(kakuro.serialize_problem())
+            target.writeSolution(kakuro.serialize_solution())
             print("grid created " + gridpath)
-            k = k +1
-        else:
-            print("KO")
+
+        if k > kept:
+            kept = k
+            lastnew = consumed
+    if k < wanted:
+        print("only {} grids, the last {} grids were all duplicates".format(k, DUPLICATE_LIMIT))
+
+    if pool:
+        pool.close()
+        pool.join()
+    if archive is not None:
+        if pending:
+            ids = archive.append(pending)
+            print("grids {} to {} added to {}".format(ids[0],ids[-1],args.archive))
+        archive.close()
+    if journal is not None:
+        def leveldir(level):
+            if level is None:
+                return filegrid
+            name = LEVELS[level]
+            if name not in buckets:
+                buckets[name] = FileGrid(griddir=dir + "/" + name)
+            return buckets[name]
+        for gridpath in journal.materialise(leveldir):
+            config.append(f"(batch {gridpath})\n")
+        print("{} grids written from the journal".format(len(config) - configstart))
+    elapsed = time.perf_counter() - start
+    print("{} grids in {:.2f} s, {:.1f} grids/s".format(k,elapsed,k/elapsed if elapsed else 0))
+    if duplicates:
+        print("{} duplicate grids skipped".format(duplicates))
+    if args.stats:
+        for line in fillstats.report(elapsed,k):
+            print(line)
+
+    if uniquetimes:
+        total = sum(uniquetimes)
+        print("uniqueness checks: {} grids, {} rejected, total {:.2f} s, mean {:.1f} ms, max {:.1f} ms".format(
+            len(uniquetimes),rejected,total,total*1000/len(uniquetimes),max(uniquetimes)*1000))
 
     config.append("\n(exit)\n")
     clpfile = dir + ".clp"
@@ -1,82 +1,338 @@
-from curses.ascii import isdigit
+from array import array
+import collections
+import hashlib
 import random
+import time
+
+# cell kinds stored in the kind plane
+# a BLACK cell is either a full black cell or a cell holding clues
+WHITE = 0
+BLACK = 1
+
+# Counters and timers of the generation, shared by the grids given the same FillStats
+#  - times    : phase -> total time in seconds
+#  - calls    : phase -> number of runs of the phase
+#  - counters : event -> count, e.g. zone repairs of check_grid()
+#  - failures : reason -> number of fill() that returned False for this reason
+#  - attempts, success : number of fill() calls and of filled grids
+# stats from several processes are added with merge()
+class FillStats:
+    def __init__(self):
+        self.times = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.counters = collections.defaultdict(int)
+        self.failures = collections.defaultdict(int)
+        self.attempts = 0
+        self.success = 0
+
+    def merge(self,other):
+        for phase, t in other.times.items():
+            self.times[phase] += t
+        for phase, n in other.calls.items():
+            self.calls[phase] += n
+        for event, n in other.counters.items():
+            self.counters[event] += n
+        for reason, n in other.failures.items():
+            self.failures[reason] += n
+        self.attempts += other.attempts
+        self.success += other.success
+
+    def as_dict(self):
+        return {"attempts": self.attempts, "success": self.success, "times": dict(self.times),
+                "calls": dict(self.calls), "counters": dict(self.counters), "failures": dict(self.failures)}
+
+    # lines of a readable summary
+    #  - elapsed : wall clock time of the generation
+    #  - grids   : number of grids kept, when some filled grids were rejected later, e.g. not unique
+    def report(self,elapsed=None,grids=None):
+        if grids is None:
+            grids = self.success
+        lines = ["fill attempts {}, filled {}, kept {}, {:.1f} attempts per kept grid".format(
+            self.attempts, self.success, grids, self.attempts / grids if grids else 0)]
+        if elapsed:
+            lines.append("{:.1f} grids/s, {:.1f} attempts/s".format(grids / elapsed, self.attempts / elapsed))
+        total = sum(self.times.values())
+        for phase, t in sorted(self.times.items(), key=lambda item: -item[1]):
+            lines.append("  {:<16} {:8.3f} s {:5.1f} % {:8.3f} ms/call".format(
+                phase, t, 100 * t / total if total else 0, 1000 * t / self.calls[phase]))
+        for event, n in sorted(self.counters.items()):
+            lines.append("  {:<24} {}".format(event, n))
+        for reason, n in sorted(self.failures.items(), key=lambda item: -item[1]):
+            lines.append("  failed: {:<16} {}".format(reason, n))
+        return lines
+
+# one search of KakuroGrid.construct_grid(), returns False when more than budget digits were tried
+# cells are given by keys, flat indexes for KakuroGrid or cell IDs for a sparse grid
+#  - white    : keys of the white cells
+#  - zones[i] : zones of the white cell i
+#  - runs[k]  : keys of the cells of zone k
+#  - digits   : digit of each cell, indexed by key
+def construct_search(white, zones, runs, digits, rng, budget):
+    for i in white:
+        digits[i] = 0
+    # used[run] : mask of the digits used in run, digit d is bit d-1
+    used = [0] * len(runs)
+    count = dict.fromkeys(white, 9)
+    buckets = [set() for _ in range(10)]
+    buckets[9].update(white)
+
+    def candidates(i):
+        mask = 0x1FF
+        for run in zones[i]:
+            mask &= ~used[run]
+        return mask
+
+    # move the free cells of the zones of i to their new bucket
+    def update(i):
+        for run in zones[i]:
+            for j in runs[run]:
+                if j != i and digits[j] == 0:
+                    n = bin(candidates(j)).count("1")
+                    if n != count[j]:
+                        buckets[count[j]].discard(j)
+                        buckets[n].add(j)
+                        count[j] = n
+
+    # stack of [cell, candidates not tried yet]
+    stack = []
+
+    # give the next candidate to the last cell of the stack
+    # cells without candidate left are removed from the stack and freed
+    def next_digit():
+        nonlocal budget
+        while stack:
+            i, mask = stack[-1]
+            if digits[i]:
+                bit = 1 << (digits[i]-1)
+                for run in zones[i]:
+                    used[run] &= ~bit
+                digits[i] = 0
+                update(i)
+            if mask:
+                budget = budget - 1
+                if budget < 0:
+                    return False
+                val = rng.choice([d for d in range(1, 10) if mask >> (d-1) & 1])
+                bit = 1 << (val-1)
+                stack[-1][1] = mask & ~bit
+                digits[i] = val
+                for run in zones[i]:
+                    used[run] |= bit
+                update(i)
+                return True
+            stack.pop()
+            count[i] = bin(candidates(i)).count("1")
+            buckets[count[i]].add(i)
+        return False
+
+    while True:
+        if not buckets[0]:
+            n = next((n for n in range(1, 10) if buckets[n]), 0)
+            if n == 0:
+                # every white cell has a digit
+                return True
+            # set.pop() resumes where the last pop stopped, min() would make the search quadratic
+            i = buckets[n].pop()
+            stack.append([i, candidates(i)])
+        if not next_digit():
+            return False
 
 class KakuroGrid:
-    def __init__(self, size=10,fpath=None,bcells=0.3,maxattempts=5):
+    # stats : FillStats updated by fill(), None to turn the instrumentation off
+    def __init__(self, size=10,fpath=None,bcells=0.3,maxattempts=5,seed=None,rng=None,solpath=None,stats=None):
+
+        # every random draw goes through this generator
+        # give a seed or a random.Random instance to reproduce a grid
+        self.rng = rng if rng is not None else random.Random(seed)
+        # % of blacks cells (full black or with clues) in the grid
+        self.blackcells = bcells
+        # when trying to fill the grid number of attempts to try
+        self.maxattempts = maxattempts
+        self.stats = stats
+        # why the last fill() returned False, None if it succeeded
+        self.failure = None
 
         if fpath is not None:
-            self.load(fpath)
+            self.load(fpath,solpath)
         else:
             # size of the grid
             self.N = size
-            # % of blacks cells (full black or with clues) in the grid
-            self.blackcells = bcells
-            # when trying to fill the grid number of attempts to try
-            self.maxattempts = maxattempts
 
-            self.grid = [[None for _ in range(self.N)] for _ in range(self.N)]
-            self.vgrid = [[None for _ in range(self.N)] for _ in range(self.N)]
-            self.hgrid = [[None for _ in range(self.N)] for _ in range(self.N)]
+            self.alloc()
 
             # set top row and left column to black cells
             for i in range(self.N):
-                self.set_value(0,i,"B/B")
-                self.set_value(i,0,"B/B")
+                self.set_black(0,i)
+                self.set_black(i,0)
+
+    # the grid is stored as flat N*N planes of small integers, cell (r,c) is at index r*N+c
+    #  - kind   : WHITE for a digit cell, BLACK for a full black or a clue cell
+    #  - digits : digit of a white cell, 0 otherwise
+    #  - hclues : sum of the horizontal zone starting right of the cell, 0 if no clue
+    #  - vclues : sum of the vertical zone starting below the cell, 0 if no clue
+    # strings like "H12/V7" are only built when printing or serializing the grid
+    def alloc(self):
+        size = self.N * self.N
+        self.kind = array('b', [BLACK]) * size
+        self.digits = array('b', bytes(size))
+        self.hclues = array('b', bytes(size))
+        self.vclues = array('b', bytes(size))
+        # zone index, see build_runs()
+        self.runs = None
+
+    # returns a copy of the grid, the zone index is not copied
+    def copy(self):
+        other = KakuroGrid.__new__(KakuroGrid)
+        other.N = self.N
+        other.blackcells = getattr(self,"blackcells",0.3)
+        other.maxattempts = getattr(self,"maxattempts",5)
+        other.rng = self.rng
+        other.stats = getattr(self,"stats",None)
+        other.failure = None
+        other.kind = array('b', self.kind)
+        other.digits = array('b', self.digits)
+        other.hclues = array('b', self.hclues)
+        other.vclues = array('b', self.vclues)
+        other.runs = None
+        return other
+
+    # build a grid from its planes (bytes or arrays of N*N values), e.g. read from an archive
+    @classmethod
+    def from_planes(cls,N,kind,digits,hclues,vclues):
+        kakuro = cls.__new__(cls)
+        kakuro.N = N
+        kakuro.blackcells = 0.3
+        kakuro.maxattempts = 5
+        kakuro.rng = random.Random()
+        kakuro.stats = None
+        kakuro.failure = None
+        kakuro.kind = array('b', kind)
+        kakuro.digits = array('b', digits)
+        kakuro.hclues = array('b', hclues)
+        kakuro.vclues = array('b', vclues)
+        kakuro.runs = None
+        return kakuro
+
+    # problem of the grid as bytes: size, then the kind, horizontal and vertical clue planes
+    # the digits are not part of the problem
+    #  - transpose : problem of the transposed grid, cell (r,c) becomes (c,r) and H/V clues are swapped
+    def problem_bytes(self,transpose=False):
+        N = self.N
+        # one byte for the size, 0xFF and 4 bytes for grids of 255 cells or more per side
+        size = bytes([N]) if N < 255 else b"\xff" + N.to_bytes(4,"little")
+        if not transpose:
+            return size + self.kind.tobytes() + self.hclues.tobytes() + self.vclues.tobytes()
+        order = [c*N + r for r in range(N) for c in range(N)]
+        planes = [bytes(array('b', [plane[i] for i in order])) for plane in (self.kind, self.vclues, self.hclues)]
+        return size + b"".join(planes)
+
+    # canonical form of the problem, the same for a grid and its transpose
+    def canonical_problem(self):
+        return min(self.problem_bytes(), self.problem_bytes(transpose=True))
+
+    # hash of the canonical problem, 16 hex digits
+    def problem_hash(self):
+        return hashlib.blake2b(self.canonical_problem(), digest_size=8).hexdigest()
 
     def get_value(self,r,c):
-        return self.grid[r][c]
-    
+        i = r*self.N + c
+        if self.kind[i] == WHITE:
+            return self.digits[i]
+        return self.cell_str(i)
+
     def isClue(self,r,c):
-        return not str(self.grid[r][c]).isdigit()
-    
-    def formatline(self,row):
+        return self.kind[r*self.N + c] != WHITE
+
+    # string representation of a cell
+    #  - white cell : its digit e.g. 7
+    #  - black cell : "B/B", "H12/B", "B/V7" or "H12/V7"
+    def cell_str(self,i):
+        if self.kind[i] == WHITE:
+            return str(self.digits[i])
+        h = self.hclues[i]
+        v = self.vclues[i]
+        return ("H"+str(h) if h else "B") + "/" + ("V"+str(v) if v else "B")
+
+    # N x N views of the grid using the historical string format
+    # only meant for printing and debugging, the planes are the reference
+    @property
+    def grid(self):
+        N = self.N
+        return [[self.get_value(r,c) for c in range(N)] for r in range(N)]
+
+    @property
+    def hgrid(self):
+        return self.clue_view(self.hclues,"H")
+
+    @property
+    def vgrid(self):
+        return self.clue_view(self.vclues,"V")
+
+    def clue_view(self,clues,prefix):
+        N = self.N
+        view = []
+        for r in range(N):
+            row = []
+            for c in range(N):
+                i = r*N + c
+                if self.kind[i] == WHITE:
+                    row.append(self.digits[i])
+                elif clues[i]:
+                    row.append(prefix + str(clues[i]))
+                else:
+                    row.append("B/B")
+            view.append(row)
+        return view
+
+    # format a line of the problem
+    #  - cells : flat indexes of the cells of the line
+    #  - clues : plane of the clues to display (hclues or vclues)
+    def formatline(self,cells,clues):
         line = ""
-        for e in row:
-            if e == "B/B":
-                line = line + "B" + " "
-            elif str(e).startswith("V") or str(e).startswith("H"):
-                line = line + e[1:] + " "
-            else:
+        for i in cells:
+            if self.kind[i] == WHITE:
                 line = line + "." + " "
+            elif clues[i]:
+                line = line + str(clues[i]) + " "
+            else:
+                line = line + "B" + " "
         return line
-    
+
+    def hline(self,r):
+        return self.formatline(range(r*self.N,(r+1)*self.N),self.hclues)
+
+    def vline(self,c):
+        return self.formatline(range(c,self.N*self.N,self.N),self.vclues)
+
     # returns a string containing the kakuro problem
     def serialize_problem(self):
         pb = "(solve "+ str(self.N)+"\n"
-        
-        for i,row in enumerate(self.hgrid):
-            # skip first row that contains only a line of "B"
-            if i == 0:
-                continue
-            line = self.formatline(row)
+
+        # skip first row that contains only a line of "B"
+        for i in range(1,self.N):
+            line = self.hline(i)
             # last line
             if i == self.N-1:
                 line = line +"/"
             pb = pb + line+"/\n"
             pb = pb + "\n"
         for c in range(1,self.N):
-            row = list()
-            for r in range(self.N):
-                row.append(self.vgrid[r][c])
-        
-            # remove first element that contains a "B"
-            #row = row[1:]
-            line = self.formatline(row)
+            line = self.vline(c)
             #last line
             if c == self.N -1:
                 line = line +"/"
             pb = pb + line+"/\n"
 
         pb = pb + ")\n\n"
-        return pb       
+        return pb
 
     def serialize_solution(self):
         sol = ""
         for r in range(self.N):
             row = ""
             for c in range(self.N):
-                row = row + "{:>8}".format(self.grid[r][c])
-            sol = sol + row + "\n"     
+                row = row + "{:>8}".format(self.cell_str(r*self.N + c))
+            sol = sol + row + "\n"
         sol = sol + "\n\n"
         return sol
 
@@ -84,171 +340,249 @@ class KakuroGrid:
     # 2 files are created:
     #  - filename : the problem
     #  - sol-filename : the solution
-    #   
+    #
     def write(self,filename):
         with open(filename,'w') as fpb:
             fpb.write("(solve "+ str(self.N)+"\n")
-            
-            for i,row in enumerate(self.hgrid):
-                # skip first row that contains only a line of "B"
-                if i == 0:
-                    continue
-                line = self.formatline(row)
+
+            # skip first row that contains only a line of "B"
+            for i in range(1,self.N):
+                line = self.hline(i)
                 # last line
                 if i == self.N-1:
                     line = line +"/"
                 fpb.write(line+"/\n")
             fpb.write("\n")
             for c in range(1,self.N):
-                row = list()
-                for r in range(self.N):
-                    row.append(self.vgrid[r][c])
-            
-                # remove first element that contains a "B"
-                #row = row[1:]
-                line = self.formatline(row)
+                line = self.vline(c)
                 #last line
                 if c == self.N -1:
                     line = line +"/"
                 fpb.write(line+"/\n")
 
             fpb.write(")\n\n")
-            
+
         with open("sol-"+filename,"w") as fsol:
-            for r in range(self.N):
-                row = ""
-                for c in range(self.N):
-                    row = row + "{:>8}".format(self.grid[r][c])
-                fsol.write(row+"\n")     
-            fsol.write("\n\n")
-
-    def load(self,filename):
+            fsol.write(self.serialize_solution())
+
+    # load a problem written by serialize_problem() or write()
+    #  - filename : the problem (.clp)
+    #  - solpath  : optional solution written by serialize_solution() (.sol)
+    # both files are read line by line in a single pass
+    def load(self,filename,solpath=None):
         with open(filename,'r') as fpb:
-            lines = fpb.readlines()
+            lines = (line.strip() for line in fpb)
             # first line is "(solve XXX" where XXX is the size of the grid
-            size = lines[0].split()[1]
-            self.N = int(size)
-            isHorizontal = True
-            r = 0
-            c = 0
-            for line in lines[1:]:
+            line = ""
+            for line in lines:
+                if line:
+                    break
+            vals = line.split()
+            if len(vals) != 2 or vals[0] != "(solve":
+                raise Exception("Not a kakuro problem ", filename)
+            self.N = int(vals[1])
+            self.alloc()
+            N = self.N
+
+            # first section is the horizontal zone: one line per row, from row 1
+            # second section is the vertical zone: one line per column, from column 1
+            # each section ends with a double slash
+            k = 0
+            for line in lines:
                 # end of the grid
-                if line.strip() == ")":
+                if line == ")":
                     break
-                if line.strip().endswith("/"):
-                    l1 = line.replace("/","")
-                    l2 = l1.replace(".","B/B")
-                    vals = l2.split()
-                    for c, v in enumerate(vals):
-                        if isdigit(v):
-                            v = int(v)
-                        self.grid[r][c] = v
-                    r = r+1
-                # first section is the horizontal zone
-                # this zone ends with a double slash
-                # from there we will be parsing the vertical zone
-                if line.strip().endswith("//"):
-                    isHorizontal = False
-
-
+                if not line.endswith("/"):
+                    continue
+                vals = line.replace("/","").split()
+                if len(vals) != N or k >= 2*(N-1):
+                    raise Exception("Invalid line in kakuro problem ", filename, line)
+                if k < N-1:
+                    r = k+1
+                    cells = range(r*N,(r+1)*N)
+                    clues = self.hclues
+                else:
+                    c = k-N+2
+                    cells = range(c,N*N,N)
+                    clues = self.vclues
+                for i, v in zip(cells,vals):
+                    if v == ".":
+                        self.kind[i] = WHITE
+                    elif v != "B":
+                        clues[i] = int(v)
+                k = k+1
+            if k != 2*(N-1):
+                raise Exception("Incomplete kakuro problem ", filename)
+
+        if solpath is not None:
+            self.load_solution(solpath)
+
+    # read the digits of a solution written by serialize_solution()
+    def load_solution(self,solpath):
+        N = self.N
+        r = 0
+        with open(solpath,'r') as fsol:
+            for line in fsol:
+                vals = line.split()
+                if not vals:
+                    continue
+                if len(vals) != N or r >= N:
+                    raise Exception("Invalid line in kakuro solution ", solpath, line)
+                for c, v in enumerate(vals):
+                    i = r*N + c
+                    if v.isdigit():
+                        if self.kind[i] != WHITE:
+                            raise Exception("Solution does not match the problem ", solpath, r, c)
+                        self.digits[i] = int(v)
+                r = r+1
+
+    def set_digit(self,r,c,val):
+        i = r*self.N + c
+        self.kind[i] = WHITE
+        self.digits[i] = val
+        self.hclues[i] = 0
+        self.vclues[i] = 0
+
+    def set_black(self,r,c):
+        i = r*self.N + c
+        self.kind[i] = BLACK
+        self.digits[i] = 0
+        self.hclues[i] = 0
+        self.vclues[i] = 0
+
+    # generic setter accepting the string format
+    #  - a digit
+    #  - "B/B" : black cell
+    #  - "V12" or "H12" : adds a vertical or horizontal clue to a black cell
     def set_value(self,r,c,val):
-        
-        if str(val).isdigit() or val == "B/B":
-            self.grid[r][c] = val
-            self.vgrid[r][c] = val
-            self.hgrid[r][c] = val
 
+        if str(val).isdigit():
+            self.set_digit(r,c,int(val))
+        elif val == "B/B":
+            self.set_black(r,c)
         else:
+            i = r*self.N + c
+            if self.kind[i] == WHITE:
+                self.set_black(r,c)
             if val.startswith("V"):
-                self.vgrid[r][c] = val
-                # grid contains Horizontal / Vertical clue
-                if "/" in str(self.grid[r][c]):
-                    clues = self.grid[r][c].split("/")
-                    self.grid[r][c] = clues[0] + "/" + val
-                else:
-                    self.grid[r][c] = "B/" + val
-                
+                self.vclues[i] = int(val[1:])
             if val.startswith("H"):
-                self.hgrid[r][c] = val
-                # grid contains Horizontal / Vertical clue
-                if "/" in str(self.grid[r][c]):
-                    clues = self.grid[r][c].split("/")
-                    self.grid[r][c] = val + "/" + clues[1]
-                else:
-                    self.grid[r][c] = val + "/B"
+                self.hclues[i] = int(val[1:])
 
 
-    def fill_grid(self):
-        # fill in the rest of the grid
+    # every inner cell becomes a white cell without digit
+    def clear_digits(self):
         for i in range(1, self.N):
             for j in range(1, self.N):
-                valid_values = set(range(1, 10)) - {self.grid[i][j-1], self.grid[i-1][j]} if i > 0 or j > 0 else set(range(1, 10))
-                val = random.choice(list(valid_values))
-                self.set_value(i,j,val)
+                self.set_digit(i,j,0)
+
+    def fill_grid(self):
+        N = self.N
+        digits = self.digits
+        # fill in the rest of the grid
+        for i in range(1, N):
+            for j in range(1, N):
+                valid_values = set(range(1, 10)) - {digits[i*N+j-1], digits[(i-1)*N+j]}
+                val = self.rng.choice(list(valid_values))
+                self.set_digit(i,j,val)
+
+    # apply a layout of black cells, a kind plane such as the ones of kakulayout
+    # the white cells keep their digit
+    def set_layout(self,layout):
+        self.runs = None
+        for i in range(self.N*self.N):
+            if layout[i] == BLACK:
+                self.set_black(i // self.N, i % self.N)
+            else:
+                self.kind[i] = WHITE
 
     def fill_black(self):
+        self.runs = None
         for i in range(1, self.N):
             for j in range(1, self.N):
-                if random.random() < self.blackcells:
-                    self.set_value(i,j,"B/B")
+                if self.rng.random() < self.blackcells:
+                    self.set_black(i,j)
+
+    # Build the index of the zones (runs) of the grid
+    # a zone is a sequence of at least 2 white cells, horizontal or vertical
+    #  - runs[k]       : tuple of the flat indexes of the cells of zone k
+    #  - runlen[k]     : number of cells of zone k
+    #  - runclue[k]    : flat index of the black cell holding the clue of zone k
+    #  - runvertical[k]: 1 for a vertical zone, 0 for a horizontal one
+    #  - hrun[i], vrun[i] : horizontal and vertical zone of cell i, -1 if none
+    # vertical zones come first (column by column), then horizontal zones (row by row)
+    # the index must be rebuilt each time black cells are added or removed
+    def build_runs(self):
+        N = self.N
+        kind = self.kind
+        self.runs = []
+        self.runlen = array('b')
+        self.runclue = array('i')
+        self.runvertical = array('b')
+        self.hrun = array('i',[-1]) * (N*N)
+        self.vrun = array('i',[-1]) * (N*N)
+
+        for c in range(N):
+            cells = []
+            for r in range(N+1):
+                i = r*N + c
+                if r < N and kind[i] == WHITE:
+                    cells.append(i)
+                    continue
+                if len(cells) > 1:
+                    self.add_run(cells,self.vrun,vertical=1)
+                cells = []
+
+        for r in range(N):
+            cells = []
+            for c in range(N+1):
+                i = r*N + c
+                if c < N and kind[i] == WHITE:
+                    cells.append(i)
+                    continue
+                if len(cells) > 1:
+                    self.add_run(cells,self.hrun,vertical=0)
+                cells = []
+
+    def add_run(self,cells,cellrun,vertical):
+        run = len(self.runs)
+        self.runs.append(tuple(cells))
+        self.runlen.append(min(len(cells),127))
+        # the clue is in the black cell just before the first cell of the zone
+        self.runclue.append(cells[0] - (self.N if vertical else 1))
+        self.runvertical.append(vertical)
+        for i in cells:
+            cellrun[i] = run
 
     # Add clues to the grid
-    #  - V12: Vertical 12 - means a sum of 12 in vertical
-    #  - H13: Horizontal 13 
+    #  - V12: Vertical 12 - means a sum of 12 in vertical
+    #  - H13: Horizontal 13
     #
     # returns True if ok
-    # returns False if the clues cannot be filled           
+    # returns False if the clues cannot be filled
     def fill_clues(self):
-        for c in range(self.N):
+        if self.runs is None:
+            self.build_runs()
+        digits = self.digits
+        for run, cells in enumerate(self.runs):
             total = 0
-            nb_elem = 0
-            # fill vertical clues
-            for r in range(self.N):
-                if self.isClue(r,c):
-                    # next row is a digit
-                    if r < self.N -1 and not self.isClue(r+1,c):
-                        for k in range(r+1,self.N):
-                            if not self.isClue(k,c):
-                                total = total + self.grid[k][c]
-                                nb_elem = nb_elem +1
-                            # either this cell is a clue or the last cell
-                            # set the value of the clue
-                            if self.isClue(k,c) or k == self.N -1:
-                                if nb_elem > 1:
-                                    self.set_value(r,c,"V"+str(total))
-                                total = 0
-                                break
-
-        # fill horizontal clues
-        for r in range(self.N):
-            total = 0
-            nb_elem = 0
-            for c in range(self.N):
-                if self.isClue(r,c):
-                    # next row is a digit
-                    if c < self.N -1 and not self.isClue(r,c+1):
-                        for k in range(c+1,self.N):
-                            if not self.isClue(r,k):
-                                total = total + self.grid[r][k]
-                                nb_elem = nb_elem +1
-                            # either this cell is a clue or the last cell
-                            # set the value of the clue
-                            if self.isClue(r,k) or k == self.N -1:
-                                if nb_elem > 1:
-                                    self.set_value(r,c,"H"+str(total))                            
-                                total = 0                                
-                                break
+            for i in cells:
+                total = total + digits[i]
+            if self.runvertical[run]:
+                self.vclues[self.runclue[run]] = total
+            else:
+                self.hclues[self.runclue[run]] = total
 
         return True
 
-    
+
     def check_zone(self,vals,nb_elem):
         if nb_elem == 1:
             return True
-        
+
         if nb_elem > 9:
             raise Exception("Too many values, a zone cannot contain more than 9 cells")
-        
+
         if nb_elem != len(vals):
             return False
 
@@ -256,164 +590,161 @@ class KakuroGrid:
 
     # change the digits in a zone so that it respects a zone constraints
     # all digits in a zone must be different
-    def change_zone(self,nb_elem,r,c,isVertical=False,isHorizontal=False):
-        assert(isVertical != isHorizontal)
-        assert(nb_elem <= 9)    
-        
-        # one element, nothing to change, it is not a zone
-        if nb_elem == 1:
-            return True
-        
+    # only the cells holding a repeated digit get a new digit, the other cells are kept
+    # the new digit is drawn among the digits used neither in the zone nor in the crossing zone of the cell
+    # when there is no such digit, a digit unused in the zone is drawn and the crossing zone will be repaired later
+    # returns the list of the cells that were changed
+    def change_zone(self,run):
+        cells = self.runs[run]
+        assert(len(cells) <= 9)
+
+        digits = self.digits
+        # zone crossing each cell of the zone
+        crossrun = self.hrun if self.runvertical[run] else self.vrun
+        count = [0] * 10
+        for i in cells:
+            count[digits[i]] += 1
         # values used in this zone
         zvals = set()
-        for i in range(nb_elem):
-            # vertical zone starting at cell (r,c) -> (r+1,c) (r+2,c) .... 
-            if isVertical:
-                hvals = set()
-                # what are the elements at left of (r+i,c) -> (r+i,c-1), (r+i,c-2), ...
-                if c > 1:
-                    for k in range(c):
-                        cleft = c -k-1
-                        if not self.isClue(r+i+1,cleft):
-                            hvals.add(self.get_value(r+i+1,cleft))
-                        else:
-                            break
-                if c < self.N -1:
-                    for cright in range(c+1,self.N):
-                        if not self.isClue(r+i+1,cright):
-                            hvals.add(self.get_value(r+i+1,cright))
-                        else:
-                            break
-                possiblevals = set([1,2,3,4,5,6,7,8,9]) - hvals -zvals
-                if len(possiblevals) == 0:
-                    return False
-                else:
-                    val = random.choice(list(possiblevals))
-                    zvals.add(val)
-                    self.set_value(r+i+1,c,val)
-            if isHorizontal:
-                vvals = set()
-                # what are the elements at the top of (r,c+1) -> (r-1,c+i), (r-2,c+i), ...
-                if r > 1:
-                    for k in range(r):
-                        rtop = r -k-1
-                        if not self.isClue(rtop,c+i+1):
-                            vvals.add(self.get_value(rtop,c+i+1))
-                        else:
-                            break
-                if r < self.N -1:
-                    for rbottom in range(r+1,self.N):
-                        if not self.isClue(rbottom,c+i+1):
-                            vvals.add(self.get_value(rbottom,c+i+1))
-                        else:
-                            break
-                possiblevals = set([1,2,3,4,5,6,7,8,9]) - vvals -zvals
-                if len(possiblevals) == 0:
-                    return False
-                else:
-                    val = random.choice(list(possiblevals))
-                    zvals.add(val)
-                    self.set_value(r,c+i+1,val)
-                        
-        return True
-                
-    
-    
+        conflicts = []
+        for i in cells:
+            if count[digits[i]] > 1:
+                conflicts.append(i)
+            else:
+                zvals.add(digits[i])
+        self.rng.shuffle(conflicts)
+
+        changed = []
+        for i in conflicts:
+            cvals = set()
+            cross = crossrun[i]
+            if cross >= 0:
+                for k in self.runs[cross]:
+                    if k != i:
+                        cvals.add(digits[k])
+            possiblevals = set([1,2,3,4,5,6,7,8,9]) - cvals -zvals
+            if len(possiblevals) == 0:
+                possiblevals = set([1,2,3,4,5,6,7,8,9]) - zvals
+                if self.stats is not None:
+                    self.stats.counters["crossing conflicts"] += 1
+            val = self.rng.choice(list(possiblevals))
+            zvals.add(val)
+            if val != digits[i]:
+                digits[i] = val
+                changed.append(i)
+
+        return changed
+
+
+
     def change_isolated(self):
-        for r in range(self.N):
-            for c in range(self.N):
+        self.runs = None
+        N = self.N
+        kind = self.kind
+        for r in range(N):
+            for c in range(N):
+                i = r*N + c
                 # check that this digit is not isolated
-                # it should have a digit next to him 
-                if not self.isClue(r,c):
+                # it should have a digit next to him
+                if kind[i] == WHITE:
                     isolated = True
-                    if r > 0 and not self.isClue(r-1,c):
+                    if r > 0 and kind[i-N] == WHITE:
                         isolated = False
-                    if r < self.N - 1 and not self.isClue(r+1,c):
+                    if r < N - 1 and kind[i+N] == WHITE:
                         isolated = False
-                    if c > 0 and not self.isClue(r,c-1):
+                    if c > 0 and kind[i-1] == WHITE:
                         isolated = False
-                    if c < self.N - 1 and not self.isClue(r,c+1):
+                    if c < N - 1 and kind[i+1] == WHITE:
                         isolated = False
                     if isolated:
                         #print("Cell isolated " + str(r) + " - " + str(c))
-                        self.set_value(r,c,"B/B")
+                        self.set_black(r,c)
 
 
-    # TODO : rewrite 
-    # either split verify and correct code , or return code true (nothing changed), and use exception if grid cannot be filled
-    # here after horizontal_verify, the digits are changed and vertical must be checked again !
-    # if verticalverify and horizontal verify are o
+    # repair the zones containing the same digit twice
+    # the zones to check are kept in a queue, at first every zone is in the queue
+    # when a cell is changed, only its crossing zone has to be checked again
+    # returns False if a zone is too long or if the grid cannot be repaired
+    # within maxattempts repairs per zone
     def check_grid(self):
-        maxattempts = self.maxattempts
-        nochange = False
-        while maxattempts >0:
-            maxattempts = maxattempts - 1
-            if nochange == True:
-                break
-
-            nochange = True
-            # vertical clues
-            for c in range(self.N):
-                nb_elem = 0
-                vals = set()
-                for r in range(self.N):
-                    if self.isClue(r,c):
-                        # next row is a digit
-                        if r < self.N -1 and not self.isClue(r+1,c):
-                            for k in range(r+1,self.N):
-                                if not self.isClue(k,c):
-                                    nb_elem = nb_elem +1
-                                    vals.add(self.grid[k][c])
-                                # either this cell is a clue or the last cell
-                                # set the value of the clue
-                                if self.isClue(k,c) or k == self.N -1:
-                                    try:
-                                        if not self.check_zone(vals,nb_elem):
-                                            self.change_zone(nb_elem,r,c,isVertical=True)
-                                            nochange = False
-                                    except Exception:
-                                        return False
-                                    nb_elem = 0
-                                    vals = set()
-                                    break
-
-            # fill horizontal clues
-            for r in range(self.N):
-                nb_elem = 0
-                vals = set()
-                for c in range(self.N):
-                    if self.isClue(r,c):
-                        # next row is a digit
-                        if c < self.N -1 and not self.isClue(r,c+1):
-                            for k in range(c+1,self.N):
-                                if not self.isClue(r,k):
-                                    nb_elem = nb_elem +1
-                                    vals.add(self.grid[r][k])
-                                # either this cell is a clue or the last cell
-                                # set the value of the clue
-                                if self.isClue(r,k) or k == self.N -1:
-                                    try:
-                                        if not self.check_zone(vals,nb_elem):
-                                            self.change_zone(nb_elem,r,c,isHorizontal=True)
-                                            nochange = False
-                                    except Exception:
-                                        return False                          
-                                    nb_elem = 0
-                                    vals = set()
-                                    break
-
-        return nochange
-
-    
-
-
-                        
+        if self.runs is None:
+            self.build_runs()
+        digits = self.digits
+        # crossrun[runvertical[run]] is the zone crossing a cell of run
+        crossrun = (self.vrun, self.hrun)
+        budget = self.maxattempts * len(self.runs)
+
+        # a zone of more than 9 cells cannot be repaired
+        for cells in self.runs:
+            if len(cells) > 9:
+                self.failure = "zone too long"
+                return False
+
+        maxbudget = budget
+        queue = collections.deque(range(len(self.runs)))
+        queued = bytearray([1]) * len(self.runs)
+        while queue:
+            run = queue.popleft()
+            queued[run] = 0
+            cells = self.runs[run]
+            vals = set()
+            for i in cells:
+                vals.add(digits[i])
+            if self.check_zone(vals,len(cells)):
+                continue
+
+            budget = budget - 1
+            if budget < 0:
+                self.failure = "repair budget"
+                if self.stats is not None:
+                    self.stats.counters["zone repairs"] += maxbudget
+                return False
+            cross = crossrun[self.runvertical[run]]
+            for i in self.change_zone(run):
+                crun = cross[i]
+                if crun >= 0 and not queued[crun]:
+                    queued[crun] = 1
+                    queue.append(crun)
+
+        if self.stats is not None:
+            self.stats.counters["zone repairs"] += maxbudget - budget
+        return True
+
+    # fill the white cells digit by digit, the layout of black cells is kept
+    # the candidates of a cell are the digits used neither in its horizontal nor in its vertical zone
+    # the free cell with the fewest candidates is filled first (MRV), with a random candidate
+    # when a free cell has no candidate left, the last filled cell takes its next candidate (backtracking)
+    # free cells are kept in buckets by number of candidates, filling a cell only updates the cells of its zones
+    # a search that tries too many digits is restarted with a larger budget, at most maxattempts times
+    # returns False if a zone is too long or if every search failed
+    def construct_grid(self):
+        if self.runs is None:
+            self.build_runs()
+        for cells in self.runs:
+            if len(cells) > 9:
+                self.failure = "zone too long"
+                return False
+
+        white = [i for i in range(self.N*self.N) if self.kind[i] == WHITE]
+        zones = {}
+        for i in white:
+            zones[i] = tuple(run for run in (self.hrun[i], self.vrun[i]) if run >= 0)
+        budget = 2 * len(white)
+        for attempt in range(self.maxattempts):
+            if construct_search(white, zones, self.runs, self.digits, self.rng, budget):
+                return True
+            if self.stats is not None:
+                self.stats.counters["construct restarts"] += 1
+            budget = budget * 2
+        self.failure = "construct budget"
+        return False
+
     def print_one_grid(self,g):
         for r in range(self.N):
             row = ""
             for c in range(self.N):
                 row = row + "{:>8}".format(g[r][c])
-            print(row)     
+            print(row)
         print("\n\n")
 
     def print_grids(self):
@@ -421,15 +752,49 @@ class KakuroGrid:
         #self.print_one_grid(self.vgrid)
         #self.print_one_grid(self.hgrid)
 
-    def fill(self):
-        self.fill_grid()
-        self.fill_black()
-        self.change_isolated()
-        if self.check_grid():
-            self.fill_clues()
-            return True
+    # fill the grid with black cells, digits and clues
+    # returns False if the grid could not be filled
+    #  - strategy : "repair"    random digits, then the zones with repeated digits are repaired
+    #               "construct" black cells first, then digits placed with backtracking, see construct_grid()
+    #  - layout   : black cells to use, e.g. from kakulayout.LayoutPool, drawn with bcells if None
+    def fill(self,strategy="repair",layout=None):
+        self.failure = None
+        if strategy == "repair":
+            self.phase(self.fill_grid)
+        elif strategy == "construct":
+            self.phase(self.clear_digits)
         else:
-            return False
+            raise Exception("Unknown fill strategy ", strategy)
+        if layout is None:
+            self.phase(self.fill_black)
+            self.phase(self.change_isolated)
+        else:
+            self.phase(self.set_layout,layout)
+        self.phase(self.build_runs)
+        if strategy == "repair":
+            isOK = self.phase(self.check_grid)
+        else:
+            isOK = self.phase(self.construct_grid)
+        if isOK:
+            self.phase(self.fill_clues)
+        if self.stats is not None:
+            self.stats.attempts += 1
+            if isOK:
+                self.stats.success += 1
+            else:
+                self.stats.failures[self.failure] += 1
+        return isOK
+
+    # run one phase of fill(), timed when stats are on
+    def phase(self,method,*args):
+        if self.stats is None:
+            return method(*args)
+        start = time.perf_counter()
+        result = method(*args)
+        name = method.__name__
+        self.stats.times[name] += time.perf_counter() - start
+        self.stats.calls[name] += 1
+        return result
 
 if __name__ == '__main__':
     kakuro = KakuroGrid(10)
@@ -443,6 +808,7 @@ if __name__ == '__main__':
 
     print(" -- 3")
     kakuro.change_isolated()
+    kakuro.build_runs()
     #kakuro.print_grids()
 
 
@@ -457,4 +823,3 @@ if __name__ == '__main__':
 
 
     #kakuro.write("test.clp")
-
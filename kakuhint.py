@@ -0,0 +1,191 @@
+from kakugrid import KakuroGrid
+from kakusolver import KakuroSolver, POPCOUNT, DIGIT, supports
+from kakudata import DATA
+import argparse
+import random
+import time
+
+# Hints for a player
+# the candidates of the puzzle alone are propagated once, then each entry of the player
+# only propagates the zones of its cell and the zones reached from them
+# erasing the last entry restores the candidates saved before it, erasing an older entry starts again
+# from the candidates of the puzzle and applies the remaining entries
+# a cell is forced when it has a single candidate and the player has not filled it yet
+# the reason of a hint is the easiest explanation found for its cell:
+#  - "last cell"      : the other cells of a zone are filled, the digit completes the sum
+#  - "crossing zones" : the combinations of the zones of the cell, with the digits already placed, leave one digit
+#  - "combinations"   : the combinations still possible with the candidates of the zone cells leave one digit
+TECHNIQUES = ["last cell", "crossing zones", "combinations"]
+
+class HintEngine:
+    def __init__(self, kakuro):
+        self.kakuro = kakuro
+        self.N = kakuro.N
+        self.solver = KakuroSolver(kakuro)
+        self.solver.reset_stats()
+        self.solver.weight = [1] * len(self.solver.runs)
+        self.runs = self.solver.runs
+        self.base = self.solver.start()
+        # False if the clues themselves have no solution
+        self.valid = self.solver.propagate(self.base, range(len(self.runs)))
+        # cell -> digit entered by the player
+        self.entries = {}
+        # (cell, cand, forced, conflict) saved before each entry, in the order of the entries
+        self.history = []
+        self.rebuild()
+
+    def zones(self, i):
+        return [run for run in (self.solver.hrun[i], self.solver.vrun[i]) if run >= 0]
+
+    # candidates with all the entries, from the candidates of the puzzle
+    def rebuild(self):
+        self.history = []
+        self.cand = list(self.base)
+        # first entry that contradicts the puzzle, -1 if none
+        # each entry is propagated when it is applied, as enter() does, the entry that fails is the conflict
+        self.conflict = -1
+        for i, d in self.entries.items():
+            bit = 1 << (d-1)
+            if not self.cand[i] & bit:
+                self.conflict = i
+                break
+            self.cand[i] = bit
+            if not self.solver.propagate(self.cand, self.zones(i)):
+                self.conflict = i
+                break
+        self.forced = set(i for i in self.solver.cells if POPCOUNT[self.cand[i]] == 1 and i not in self.entries)
+
+    # the player puts digit d in cell (r,c)
+    # returns False if the entry contradicts the puzzle or the previous entries
+    def enter(self, r, c, d):
+        if not 1 <= d <= 9:
+            raise Exception("Invalid digit ", d)
+        i = r*self.N + c
+        self.erase(r, c)
+        self.history.append((i, list(self.cand), set(self.forced), self.conflict))
+        self.entries[i] = d
+        self.forced.discard(i)
+        if self.conflict >= 0:
+            return False
+        bit = 1 << (d-1)
+        if not self.cand[i] & bit:
+            self.conflict = i
+            return False
+        self.cand[i] = bit
+        changes = []
+        if not self.solver.propagate(self.cand, self.zones(i), changes):
+            self.conflict = i
+            return False
+        for j in changes:
+            if POPCOUNT[self.cand[j]] == 1 and j not in self.entries:
+                self.forced.add(j)
+        return True
+
+    # the player erases cell (r,c)
+    def erase(self, r, c):
+        i = r*self.N + c
+        if i not in self.entries:
+            return
+        del self.entries[i]
+        if self.history and self.history[-1][0] == i:
+            _, self.cand, self.forced, self.conflict = self.history.pop()
+        else:
+            self.rebuild()
+
+    def zone_name(self, run):
+        return "{} zone {} in {} cells".format("vertical" if self.kakuro.runvertical[run] else "horizontal",
+                                               self.solver.runsum[run], len(self.runs[run]))
+
+    # digits of a mask, e.g. "1 3 9"
+    def digits_str(self, mask):
+        return " ".join(str(d) for d in range(1, 10) if mask >> (d-1) & 1)
+
+    # returns (technique, reason) for the forced cell i
+    def explain(self, i, d):
+        entries = self.entries
+        zones = self.zones(i)
+        for run in zones:
+            others = [j for j in self.runs[run] if j != i]
+            if all(j in entries for j in others):
+                total = sum(entries[j] for j in others)
+                return "last cell", "{}: {} - {} = {}".format(self.zone_name(run), self.solver.runsum[run], total, d)
+        mask = 0x1FF
+        parts = []
+        for run in zones:
+            placed = 0
+            for j in self.runs[run]:
+                if j in entries:
+                    placed |= 1 << (entries[j]-1)
+            allowed = DATA.allowed_digits(self.solver.runsum[run], len(self.runs[run]), placed) & ~placed
+            mask &= allowed
+            parts.append("{} allows {}".format(self.zone_name(run), self.digits_str(allowed)))
+        if mask == 1 << (d-1):
+            return "crossing zones", ", ".join(parts) + ": only {} fits".format(d)
+        parts = []
+        for run in zones:
+            cells = self.runs[run]
+            combos = [combo for combo in self.solver.combos[run]
+                      if supports(tuple([self.cand[j] & combo for j in cells])) is not None]
+            parts.append("{} can only be {}".format(self.zone_name(run),
+                                                  " or ".join(self.digits_str(combo).replace(" ", "") for combo in combos)))
+        return "combinations", ", ".join(parts) + ": with the candidates of the other cells only {} fits".format(d)
+
+    # next forced cell
+    # returns a dict with cell (r, c), digit, technique and reason, None if no cell is forced
+    # a wrong entry is reported first, with the technique "error"
+    def hint(self):
+        if self.conflict >= 0:
+            r, c = divmod(self.conflict, self.N)
+            return {"cell": (r, c), "digit": self.entries.get(self.conflict, 0), "technique": "error",
+                    "reason": "this digit contradicts the clues or the other digits"}
+        if not self.forced:
+            return None
+        i = min(self.forced)
+        d = DIGIT[self.cand[i]]
+        technique, reason = self.explain(i, d)
+        r, c = divmod(i, self.N)
+        return {"cell": (r, c), "digit": d, "technique": technique, "reason": reason}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play a puzzle by following the hints")
+    parser.add_argument("grid",help="problem (.clp) to play, a new grid if none",nargs='?')
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=20)
+    parser.add_argument("--seed",help="Seed of the random generator",type=int)
+    parser.add_argument("-v","--verbose",action='store_true',help="print each hint")
+    args = parser.parse_args()
+
+    if args.grid:
+        kakuro = KakuroGrid(fpath=args.grid)
+    else:
+        rng = random.Random(args.seed)
+        kakuro = KakuroGrid(args.size, bcells=0.4, maxattempts=10, rng=rng)
+        while not kakuro.fill():
+            kakuro = KakuroGrid(args.size, bcells=0.4, maxattempts=10, rng=rng)
+
+    start = time.perf_counter()
+    engine = HintEngine(kakuro)
+    print("setup {:.2f} ms".format((time.perf_counter() - start) * 1000))
+    # follow the hints, when no cell is forced the digit of the generated solution is entered
+    times = []
+    counts = dict.fromkeys(TECHNIQUES, 0)
+    guesses = 0
+    while len(engine.entries) < len(engine.solver.cells):
+        start = time.perf_counter()
+        hint = engine.hint()
+        times.append(time.perf_counter() - start)
+        if hint is None:
+            i = next(i for i in engine.solver.cells if i not in engine.entries)
+            r, c = divmod(i, engine.N)
+            d = kakuro.digits[i]
+            guesses += 1
+        else:
+            (r, c), d = hint["cell"], hint["digit"]
+            counts[hint["technique"]] = counts.get(hint["technique"], 0) + 1
+            if args.verbose:
+                print(hint)
+        start = time.perf_counter()
+        engine.enter(r, c, d)
+        times[-1] += time.perf_counter() - start
+    times.sort()
+    print("{} cells, {} hints {}, {} digits from the solution".format(len(times), len(times) - guesses, counts, guesses))
+    print("hint + entry: median {:.3f} ms, max {:.3f} ms".format(times[len(times)//2] * 1000, times[-1] * 1000))
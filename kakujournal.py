@@ -0,0 +1,171 @@
+from kakugrid import KakuroGrid
+from kakufile import FileGrid
+import argparse
+import struct
+import json
+import zlib
+import os
+
+# Write-ahead journal of a generation run
+# accepted grids are appended to the journal by groups, each group is written at once and synced,
+# a crash loses at most the group being built
+#
+#  group  : magic "KJGR", number of grids, tasks, length and crc32 of the body
+#           - tasks : generation tasks consumed when the group was written, a resumed run skips them
+#  body   : one record per grid
+#           - size N (2 bytes), level index (255 for none), hash of the problem (8 bytes)
+#           - kind, horizontal clues, vertical clues and digits planes, N*N bytes each
+#  files  : magic "KJMT", written before the grids are materialised, its body is the JSON
+#           {directory: first grid ID} of the IDs reserved for the grids of each directory
+#
+# a group cut by a crash, or with a wrong crc, ends the journal, it is removed when the journal is opened
+# materialise() writes the .clp and .sol files of the journaled grids in one pass with the IDs recorded
+# in the "KJMT" group, a materialisation stopped by a crash writes the same files when it is run again
+class GridJournal():
+    GROUP = struct.Struct("<4sIIII")
+    RECORD = struct.Struct("<HB8s")
+    GRIDS = b"KJGR"
+    FILES = b"KJMT"
+    NOLEVEL = 255
+
+    # - group : grids written to the journal at once
+    def __init__(self,path,group=100):
+        self.path = path
+        self.group = group
+        # committed grids, tasks consumed, hashes of the committed problems
+        self.count = 0
+        self.tasks = 0
+        self.hashes = set()
+        # directory -> first ID, None until materialise() reserved the IDs
+        self.firstids = None
+        # bytes of a cut group removed by recover()
+        self.truncated = 0
+        self.pending = []
+        self.pendingtasks = 0
+        self.recover()
+
+    # groups of the journal, (magic, count, tasks, body) for each valid group
+    def groups(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path,"rb") as f:
+            while True:
+                header = f.read(self.GROUP.size)
+                if len(header) < self.GROUP.size:
+                    return
+                magic, count, tasks, length, crc = self.GROUP.unpack(header)
+                body = f.read(length)
+                if magic not in (self.GRIDS, self.FILES) or len(body) < length or zlib.crc32(body) != crc:
+                    return
+                yield magic, count, tasks, body
+
+    # records of a group body, (N, level, hash, planes)
+    def records(self,body):
+        pos = 0
+        while pos < len(body):
+            N, level, phash = self.RECORD.unpack_from(body,pos)
+            pos = pos + self.RECORD.size
+            size = N*N
+            planes = [body[pos + k*size:pos + (k+1)*size] for k in range(4)]
+            pos = pos + 4*size
+            yield N, level, phash, planes
+
+    # read the committed groups and cut what follows them
+    def recover(self):
+        valid = 0
+        for magic, count, tasks, body in self.groups():
+            valid = valid + self.GROUP.size + len(body)
+            if magic == self.FILES:
+                self.firstids = json.loads(body.decode())
+                continue
+            self.count = self.count + count
+            self.tasks = tasks
+            for N, level, phash, planes in self.records(body):
+                self.hashes.add(phash.hex())
+        if os.path.exists(self.path) and os.path.getsize(self.path) > valid:
+            self.truncated = os.path.getsize(self.path) - valid
+            with open(self.path,"r+b") as f:
+                f.truncate(valid)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    # add an accepted grid, the group is committed when it is full
+    #  - level : index of the difficulty level in kakurate.LEVELS, None if the grid is not bucketed
+    #  - tasks : generation tasks consumed so far
+    def add(self,kakuro,level=None,tasks=0):
+        phash = kakuro.problem_hash()
+        record = self.RECORD.pack(kakuro.N,self.NOLEVEL if level is None else level,bytes.fromhex(phash))
+        self.pending.append(record + kakuro.kind.tobytes() + kakuro.hclues.tobytes()
+                            + kakuro.vclues.tobytes() + kakuro.digits.tobytes())
+        self.pendingtasks = tasks
+        self.hashes.add(phash)
+        if len(self.pending) >= self.group:
+            self.commit()
+
+    def write_group(self,magic,count,tasks,body):
+        with open(self.path,"ab") as f:
+            f.write(self.GROUP.pack(magic,count,tasks,len(body),zlib.crc32(body)) + body)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # write the pending grids as one group
+    def commit(self):
+        if not self.pending:
+            return
+        self.write_group(self.GRIDS,len(self.pending),self.pendingtasks,b"".join(self.pending))
+        self.count = self.count + len(self.pending)
+        self.tasks = self.pendingtasks
+        self.pending = []
+
+    # committed grids, yields (KakuroGrid, level index or None)
+    def grids(self):
+        for magic, count, tasks, body in self.groups():
+            if magic != self.GRIDS:
+                continue
+            for N, level, phash, planes in self.records(body):
+                kind, hclues, vclues, digits = planes
+                yield KakuroGrid.from_planes(N,kind,digits,hclues,vclues), None if level == self.NOLEVEL else level
+
+    # write the files of the committed grids, then remove the journal
+    #  - filegrid : function giving the FileGrid of a level index or None
+    # returns the paths of the problems in journal order
+    def materialise(self,filegrid):
+        self.commit()
+        # grids of each directory, in journal order
+        bydir = {}
+        order = []
+        for kakuro, level in self.grids():
+            target = filegrid(level)
+            if target.griddir not in bydir:
+                bydir[target.griddir] = (target, [])
+            bydir[target.griddir][1].append(kakuro)
+            order.append(target.griddir)
+        if self.firstids is None:
+            self.firstids = {}
+            for griddir, (target, kakuros) in bydir.items():
+                self.firstids[griddir] = target.createGridIDs(len(kakuros))
+            self.write_group(self.FILES,0,self.tasks,json.dumps(self.firstids).encode())
+        paths = {}
+        for griddir, (target, kakuros) in bydir.items():
+            if griddir not in self.firstids:
+                raise Exception("Journal already materialised in ", list(self.firstids))
+            paths[griddir] = iter(target.writeGrids(self.firstids[griddir],kakuros))
+        result = [next(paths[griddir]) for griddir in order]
+        os.remove(self.path)
+        return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show or materialise the journal of a kakugen run")
+    parser.add_argument("journal",help="journal file, e.g. grids/.gridjournal")
+    parser.add_argument("-d","--directory",help="materialise the grids in this directory")
+    args = parser.parse_args()
+
+    journal = GridJournal(args.journal)
+    print("{} grids committed, {} tasks consumed, {} bytes cut".format(journal.count,journal.tasks,journal.truncated))
+    if journal.firstids is not None:
+        print("materialisation started, first IDs {}".format(journal.firstids))
+    if args.directory:
+        filegrid = FileGrid(griddir=args.directory)
+        for path in journal.materialise(lambda level: filegrid):
+            print("grid created " + path)
@@ -0,0 +1,165 @@
+from kakugrid import KakuroGrid, WHITE, BLACK
+from array import array
+import argparse
+import random
+
+# Layouts of black cells, valid by construction
+# a layout is a kind plane (WHITE / BLACK per cell, see KakuroGrid) where:
+#  - the top row and the left column are black
+#  - every white cell belongs to a horizontal and a vertical zone of 2 to 9 cells
+#  - with symmetric, the inner (N-1)x(N-1) square is unchanged by a half turn, (r,c) <-> (N-r,N-c)
+# black cells are first drawn with probability bcells, then the layout is repaired:
+#  - a zone of more than 9 cells is cut by a black cell leaving 2 cells or more on each side
+#  - a white cell alone in its row or column zone extends it with a black neighbour,
+#    after EXTEND_ROUNDS rounds it becomes black instead so that the repair always ends
+EXTEND_ROUNDS = 3
+
+# lengths of the zones going through each cell, 0 for a black cell
+# returns (hlen, vlen)
+def zone_lengths(N, kind):
+    hlen = array('b', bytes(N*N))
+    vlen = array('b', bytes(N*N))
+    for line in range(N):
+        for step, first, lens in ((1, line*N, hlen), (N, line, vlen)):
+            cells = []
+            for k in range(N+1):
+                i = first + k*step
+                if k < N and kind[i] == WHITE:
+                    cells.append(i)
+                    continue
+                for j in cells:
+                    lens[j] = len(cells)
+                cells = []
+    return hlen, vlen
+
+# zones of more than 9 cells, as lists of cells
+def long_zones(N, kind, hlen, vlen):
+    zones = []
+    for line in range(N):
+        for step, first, lens in ((1, line*N, hlen), (N, line, vlen)):
+            k = 0
+            while k < N:
+                i = first + k*step
+                if lens[i] > 9:
+                    zones.append([first + (k+m)*step for m in range(lens[i])])
+                    k = k + lens[i]
+                else:
+                    k = k + 1
+    return zones
+
+def make_layout(N, bcells, rng, symmetric=False):
+    kind = array('b', [BLACK]) * (N*N)
+
+    def pair(i):
+        r, c = divmod(i, N)
+        return (N-r)*N + (N-c)
+
+    def set_kind(i, k):
+        kind[i] = k
+        if symmetric:
+            kind[pair(i)] = k
+
+    # black neighbours of i along a line that can become white, the borders stay black
+    def extensions(i, step):
+        r, c = divmod(i, N)
+        cells = []
+        for j in (i-step, i+step):
+            if 0 <= j < N*N and kind[j] == BLACK and j // N > 0 and j % N > 0 \
+                    and (step == N or j // N == r):
+                cells.append(j)
+        return cells
+
+    for r in range(1, N):
+        for c in range(1, N):
+            i = r*N + c
+            if symmetric and pair(i) < i:
+                kind[i] = kind[pair(i)]
+            elif rng.random() >= bcells:
+                kind[i] = WHITE
+
+    rounds = 0
+    while True:
+        hlen, vlen = zone_lengths(N, kind)
+        changed = False
+        for cells in long_zones(N, kind, hlen, vlen):
+            # both parts keep at least 2 cells, and at most 9 when possible
+            L = len(cells)
+            lo, hi = max(2, L-10), min(9, L-3)
+            if lo > hi:
+                lo, hi = 2, L-3
+            set_kind(cells[rng.randint(lo, hi)], BLACK)
+            changed = True
+        if changed:
+            continue
+        rounds = rounds + 1
+        for i in range(N*N):
+            if kind[i] != WHITE:
+                continue
+            for step, lens in ((1, hlen), (N, vlen)):
+                if lens[i] != 1 or kind[i] != WHITE:
+                    continue
+                # extend the zone with a black neighbour during the first rounds, else remove the cell
+                cells = extensions(i, step) if rounds <= EXTEND_ROUNDS else []
+                if cells:
+                    set_kind(rng.choice(cells), WHITE)
+                else:
+                    set_kind(i, BLACK)
+                changed = True
+        if not changed:
+            return kind
+
+# a layout with at least one zone
+def draw_layout(N, bcells, rng, symmetric=False):
+    while True:
+        layout = make_layout(N, bcells, rng, symmetric)
+        if WHITE in layout:
+            return layout
+
+# Pool of layouts for each (size, bcells)
+# a layout is given reuse times, then it is replaced by a new one
+# the digit filler gets a valid layout each time instead of rejecting whole grids
+#  - poolsize : number of layouts kept for each (size, bcells)
+#  - reuse    : number of grids made from a layout
+class LayoutPool:
+    def __init__(self, poolsize=16, reuse=8, symmetric=False, seed=None, rng=None):
+        self.poolsize = poolsize
+        self.reuse = reuse
+        self.symmetric = symmetric
+        self.rng = rng if rng is not None else random.Random(seed)
+        # (size, bcells) -> list of [layout, number of grids made from it]
+        self.pools = {}
+        self.stats = {"layouts": 0, "given": 0}
+
+    def new_layout(self, size, bcells):
+        self.stats["layouts"] += 1
+        return draw_layout(size, bcells, self.rng, self.symmetric)
+
+    # returns a layout for a grid of this size and black cells density
+    def get(self, size, bcells):
+        pool = self.pools.setdefault((size, bcells), [])
+        if len(pool) < self.poolsize:
+            entry = [self.new_layout(size, bcells), 0]
+            pool.append(entry)
+        else:
+            entry = self.rng.choice(pool)
+        entry[1] += 1
+        if entry[1] >= self.reuse:
+            pool.remove(entry)
+        self.stats["given"] += 1
+        return entry[0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show a black cells layout")
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=10)
+    parser.add_argument("-b","--bcells",help="Black cell density",type=float, default=0.3)
+    parser.add_argument("--symmetric",action='store_true',help="rotational symmetry")
+    parser.add_argument("--seed",help="Seed of the random generator",type=int)
+    args = parser.parse_args()
+
+    layout = make_layout(args.size, args.bcells, random.Random(args.seed), args.symmetric)
+    for r in range(args.size):
+        print("".join("#" if layout[r*args.size + c] == BLACK else "." for c in range(args.size)))
+    print("density {:.2f}".format(list(layout).count(BLACK) / (args.size*args.size)))
+    kakuro = KakuroGrid(args.size, seed=args.seed)
+    if kakuro.fill("construct", layout):
+        print(kakuro.serialize_problem())
@@ -0,0 +1,261 @@
+from kakugrid import KakuroGrid, WHITE, BLACK
+from kakusolver import make_solver, DIGIT, POPCOUNT
+from kakudata import DATA
+from array import array
+import argparse
+import random
+import time
+
+# Make a grid with several solutions unique by small changes instead of generating a new grid
+# the solver gives a second solution, the cells where it differs from the digits of the grid
+# are the ambiguous cells, each step changes the grid around one of them:
+#  - "digit" : a cell gets another digit, the clues of its zones change
+#  - "swap"  : two cells of a zone exchange their digits, the clue of the zone is kept and the
+#              clues of the crossing zones change (the 2x2 rectangle of a deadly pattern is broken)
+#  - "flip"  : the cell becomes a black cell, its zones are split and get new clues
+# the digits of the grid always stay a solution, a step never makes the grid invalid
+# before the search, a zone holding two cells that belong to no other zone is broken by a flip:
+# these two cells can always exchange their digits, no clue can make such a grid unique
+# then a change is kept only if it does not increase the number of candidates left by propagation,
+# the search climbs toward grids that propagation solves alone, the other changes are undone
+# the second solution found is kept as a witness: while it still matches the new clues the grid
+# is known to be ambiguous and the solver is not run
+# "digit" and "swap" keep the black cells, the solver keeps its zone index and only the
+# combinations of the changed zones are updated, "flip" builds the zone index and the solver again
+# the number of flips matters more than the number of steps, grids with several solutions made unique
+# with the propagation backend, bcells 0.4, 40 grids per size (20 at size 14):
+#   size  8 : 55% with 200 steps and N // 2 flips, 85% with 400 steps and 2*N flips, 0.15 s per grid
+#   size 10 : 43% with 200 steps and N // 2 flips, 90% with 400 steps and 2*N flips, 0.4 s per grid
+#   size 14 :  0% with 200 steps and N // 2 flips, 55% with 400 steps and 2*N flips, 2.4 s per grid
+MUTATIONS = ["digit", "swap", "flip"]
+WEIGHTS = [4, 4, 1]
+
+class UniqueImprover:
+    #  - steps   : number of changes tried before giving up
+    #  - flips   : at most flips black cells are added by the search, 2*N if None
+    #  - backend : solver backend, see kakusolver.make_solver()
+    def __init__(self, kakuro, steps=400, flips=None, backend="auto", rng=None):
+        self.kakuro = kakuro
+        self.steps = steps
+        self.flips = flips if flips is not None else 2 * kakuro.N
+        self.backend = backend
+        self.rng = rng if rng is not None else kakuro.rng
+        self.stats = {"steps": 0, "solves": 0, "witness": 0, "undone": 0, "pairs": 0, "time": 0.0}
+        for mutation in MUTATIONS:
+            self.stats[mutation] = 0
+        self.new_solver()
+
+    def new_solver(self):
+        if self.kakuro.runs is None:
+            self.kakuro.build_runs()
+        self.solver = make_solver(self.kakuro, self.backend)
+        self.solver.reset_stats()
+        self.solver.weight = [1] * len(self.solver.runs)
+
+    def zones(self, i):
+        return [run for run in (self.kakuro.hrun[i], self.kakuro.vrun[i]) if run >= 0]
+
+    # digits used by the zones of cell i, except the digit of i
+    def used(self, i):
+        digits = self.kakuro.digits
+        mask = 0
+        for run in self.zones(i):
+            for j in self.kakuro.runs[run]:
+                if j != i:
+                    mask |= 1 << digits[j]
+        return mask
+
+    # new clue of each zone in runs, from the digits of the grid
+    def update_clues(self, runs):
+        kakuro = self.kakuro
+        for run in runs:
+            cells = kakuro.runs[run]
+            total = sum(kakuro.digits[i] for i in cells)
+            clues = kakuro.vclues if kakuro.runvertical[run] else kakuro.hclues
+            clues[kakuro.runclue[run]] = total
+            self.solver.runsum[run] = total
+            self.solver.combos[run] = DATA.get_combinations(total, len(cells))
+
+    # candidates left by propagation besides the digit of each cell, 0 when propagation solves the grid
+    def undecided(self):
+        cand = self.solver.start()
+        self.solver.propagate(cand, range(len(self.solver.runs)))
+        return sum(POPCOUNT[cand[i]] - 1 for i in self.solver.cells)
+
+    def snapshot(self):
+        kakuro = self.kakuro
+        return (array('b', kakuro.kind), array('b', kakuro.digits),
+                array('b', kakuro.hclues), array('b', kakuro.vclues), self.flips)
+
+    # undo the last mutation
+    def restore(self, snapshot):
+        kakuro = self.kakuro
+        kind, kakuro.digits, kakuro.hclues, kakuro.vclues, flips = snapshot
+        if flips != self.flips:
+            kakuro.kind = kind
+            self.flips = flips
+            kakuro.build_runs()
+            self.new_solver()
+        else:
+            self.update_clues(self.changed)
+
+    # the mutations return False when they cannot be applied to cell i
+    # self.changed holds the zones whose clue changed
+    def mutate_digit(self, i):
+        used = self.used(i)
+        choices = [d for d in range(1, 10) if d != self.kakuro.digits[i] and not used >> d & 1]
+        if not choices:
+            return False
+        self.kakuro.digits[i] = self.rng.choice(choices)
+        self.changed = self.zones(i)
+        self.update_clues(self.changed)
+        return True
+
+    def mutate_swap(self, i):
+        kakuro = self.kakuro
+        digits = kakuro.digits
+        run = self.rng.choice(self.zones(i))
+        j = self.rng.choice([j for j in kakuro.runs[run] if j != i])
+        # the crossing zones of i and j must not hold the digit coming in
+        cross = kakuro.hrun if kakuro.runvertical[run] else kakuro.vrun
+        for a, b in ((i, j), (j, i)):
+            if cross[a] >= 0 and any(digits[k] == digits[b] for k in kakuro.runs[cross[a]] if k != a):
+                return False
+        digits[i], digits[j] = digits[j], digits[i]
+        self.changed = [cross[k] for k in (i, j) if cross[k] >= 0]
+        self.update_clues(self.changed)
+        return True
+
+    def mutate_flip(self, i):
+        if self.flips <= 0:
+            return False
+        self.flips -= 1
+        self.flip(i)
+        return True
+
+    # cell i becomes black, the white cells left alone become black too
+    def flip(self, i):
+        kakuro = self.kakuro
+        N = kakuro.N
+        kakuro.set_black(i // N, i % N)
+        kakuro.change_isolated()
+        # zones may disappear, their clue cells must not keep the old clue
+        for k in range(N*N):
+            if kakuro.kind[k] == BLACK:
+                kakuro.hclues[k] = 0
+                kakuro.vclues[k] = 0
+        kakuro.build_runs()
+        kakuro.fill_clues()
+        self.new_solver()
+        self.changed = []
+
+    # a cell to flip in a zone holding two cells without crossing zone, -1 if there is none
+    # a cell at the end of the zone is taken first, the zone is shortened instead of being split
+    def free_pair(self):
+        kakuro = self.kakuro
+        for run, cells in enumerate(kakuro.runs):
+            cross = kakuro.hrun if kakuro.runvertical[run] else kakuro.vrun
+            free = [i for i in cells if cross[i] < 0]
+            if len(free) > 1:
+                for i in free:
+                    if i == cells[0] or i == cells[-1]:
+                        return i
+                return free[0]
+        return -1
+
+    # True while the witness is still a second solution of the grid
+    # a flip may have turned every cell where it differs into a black cell
+    def witness_holds(self, witness):
+        kakuro = self.kakuro
+        if not any(witness[i] != kakuro.digits[i] for i in range(kakuro.N*kakuro.N) if kakuro.kind[i] == WHITE):
+            return False
+        for run, cells in enumerate(kakuro.runs):
+            clues = kakuro.vclues if kakuro.runvertical[run] else kakuro.hclues
+            if sum(witness[i] for i in cells) != clues[kakuro.runclue[run]]:
+                return False
+        return True
+
+    # second solution of the grid as a list of digits, None if the grid is unique
+    def second_solution(self):
+        self.stats["solves"] += 1
+        digits = self.kakuro.digits
+        for cand in self.solver.run(2):
+            solution = [DIGIT.get(m, 0) for m in cand]
+            if any(solution[i] != digits[i] for i in self.solver.cells):
+                return solution
+        return None
+
+    # change the grid until its solution is unique
+    # returns True if the grid is unique, the grid is changed even when False is returned
+    def improve(self):
+        start = time.perf_counter()
+        i = self.free_pair()
+        while i >= 0:
+            self.flip(i)
+            self.stats["pairs"] += 1
+            i = self.free_pair()
+        witness = self.second_solution()
+        score = self.undecided()
+        while witness is not None and self.stats["steps"] < self.steps:
+            self.stats["steps"] += 1
+            kakuro = self.kakuro
+            ambiguous = [i for i in range(kakuro.N*kakuro.N)
+                         if kakuro.kind[i] == WHITE and witness[i] != kakuro.digits[i]]
+            mutation = self.rng.choices(MUTATIONS, WEIGHTS)[0]
+            if mutation == "flip":
+                # a cell of a single zone can take other digits more easily, flip it first
+                lone = [i for i in ambiguous if kakuro.hrun[i] < 0 or kakuro.vrun[i] < 0]
+                ambiguous = lone or ambiguous
+            i = self.rng.choice(ambiguous)
+            snapshot = self.snapshot()
+            if not getattr(self, "mutate_" + mutation)(i):
+                continue
+            newscore = self.undecided()
+            if newscore > score:
+                self.restore(snapshot)
+                self.stats["undone"] += 1
+                continue
+            score = newscore
+            self.stats[mutation] += 1
+            if score == 0:
+                witness = None
+            elif self.witness_holds(witness):
+                self.stats["witness"] += 1
+                continue
+            witness = self.second_solution()
+        self.stats["time"] = time.perf_counter() - start
+        return witness is None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare regenerating and improving grids until they are unique")
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=8)
+    parser.add_argument("-g","--grids",help="Number of unique grids",type=int, default=20)
+    parser.add_argument("-b","--bcells",help="Black cell density",type=float, default=0.4)
+    parser.add_argument("--steps",help="changes tried per grid",type=int, default=400)
+    parser.add_argument("--flips",help="black cells added per grid, 2*size if not given",type=int)
+    parser.add_argument("-a","--attempts",help="fill attempts of each method, it stops there even without all the grids",type=int, default=1000)
+    parser.add_argument("--seed",help="Seed of the random generator",type=int)
+    args = parser.parse_args()
+
+    for improve in (False, True):
+        rng = random.Random(args.seed)
+        start = time.perf_counter()
+        attempts = 0
+        filled = 0
+        unique = 0
+        improved = 0
+        while unique < args.grids and attempts < args.attempts:
+            attempts += 1
+            kakuro = KakuroGrid(args.size, bcells=args.bcells, maxattempts=10, rng=rng)
+            if not kakuro.fill():
+                continue
+            filled += 1
+            if make_solver(kakuro).is_unique():
+                unique += 1
+            elif improve and UniqueImprover(kakuro, args.steps, args.flips, rng=rng).improve():
+                improved += 1
+                unique += 1
+        elapsed = time.perf_counter() - start
+        print("{}: {} unique grids of {}, {} fill attempts, {} filled grids, {} improved, {:.2f} s, {:.1f} ms per unique grid".format(
+            "improve" if improve else "regenerate", unique, args.grids, attempts, filled, improved, elapsed,
+            1000 * elapsed / unique if unique else 0.0))
@@ -0,0 +1,220 @@
+from kakugrid import KakuroGrid
+from kakufile import FileGrid
+from kakusolver import make_solver, BACKENDS
+from kakurate import KakuroRater, LEVELS
+from kakulayout import LayoutPool
+from kakumutate import UniqueImprover
+from queue import Empty, Full
+import multiprocessing
+import argparse
+import random
+import time
+import sys
+
+# Generation pipeline
+#
+#  generators --(grids)--> verifiers --(verdicts)--> writer
+#
+#  - generators : fill grids and send their planes to the verifiers
+#  - verifiers  : check the uniqueness and the difficulty of each grid, the digits come from the filler
+#                 and the clues are their sums, the solution itself is not checked again
+#                 with --improve, a grid with several solutions is changed until it is unique
+#  - writer     : the main process, writes the accepted grids to a FileGrid by batches
+# the queues are bounded, a stage that gets ahead blocks until the next one catches up
+# every stage stops when the writer has accepted the number of grids asked for
+# only accepted grids are written, no separate solving run is needed
+
+# wait time of the blocking queue operations, so that the stop event is seen
+POLL = 0.1
+
+# grid sent between processes, only the planes are pickled
+def encode(kakuro):
+    return (kakuro.N, kakuro.kind.tobytes(), kakuro.digits.tobytes(),
+            kakuro.hclues.tobytes(), kakuro.vclues.tobytes())
+
+def decode(planes):
+    return KakuroGrid.from_planes(*planes)
+
+# put item in queue, waiting while the queue is full
+# returns False if the pipeline stopped meanwhile
+def put(queue, item, stop):
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=POLL)
+            return True
+        except Full:
+            continue
+    return False
+
+def generate_stage(options, seed, out, generated, stop):
+    # items still buffered when the pipeline stops are dropped
+    out.cancel_join_thread()
+    rng = random.Random(seed)
+    # construct cannot split the long zones of random black cells, it always fills valid layouts
+    layoutpool = LayoutPool(symmetric=options.symmetric, rng=rng) if options.layouts or options.symmetric or options.strategy == "construct" else None
+    while not stop.is_set():
+        layout = layoutpool.get(options.size, options.bcells) if layoutpool else None
+        kakuro = KakuroGrid(options.size, maxattempts=10, bcells=options.bcells, rng=rng)
+        if not kakuro.fill(options.strategy, layout):
+            continue
+        with generated.get_lock():
+            generated.value += 1
+        if not put(out, encode(kakuro), stop):
+            break
+
+# sends ("accept", planes, rating) or ("reject", reason, None) for each grid
+def verify_stage(options, inq, out, stop):
+    out.cancel_join_thread()
+    while not stop.is_set():
+        try:
+            planes = inq.get(timeout=POLL)
+        except Empty:
+            continue
+        kakuro = decode(planes)
+        verdict = ("accept", planes, None)
+        if options.unique and not make_solver(kakuro, options.solver).is_unique():
+            if options.improve and UniqueImprover(kakuro, backend=options.solver).improve():
+                planes = encode(kakuro)
+                verdict = ("accept", planes, None)
+            else:
+                verdict = ("reject", "not unique", None)
+        if verdict[0] == "accept" and options.difficulty:
+            rating = KakuroRater(kakuro).rate()
+            if rating[1] < 0 or LEVELS[rating[1]] not in options.difficulty:
+                verdict = ("reject", "difficulty", None)
+            else:
+                verdict = ("accept", planes, rating)
+        if not put(out, verdict, stop):
+            break
+
+# writes accepted grids to a FileGrid, flush grids at a time
+# duplicates are skipped with the hash index of the directory and the hashes of the buffer
+# the hashes are registered when the grids are written, a grid lost in the buffer is never in the index
+class PipelineWriter:
+    def __init__(self, filegrid, flush=100):
+        self.filegrid = filegrid
+        self.flush_size = flush
+        self.buffer = []
+        self.hashes = set()
+        self.written = 0
+        self.duplicates = 0
+
+    # grids written or waiting in the buffer
+    def count(self):
+        return self.written + len(self.buffer)
+
+    # returns False for a duplicate
+    def add(self, kakuro):
+        phash = kakuro.problem_hash()
+        if phash in self.hashes or self.filegrid.hasHash(phash):
+            self.duplicates += 1
+            return False
+        self.hashes.add(phash)
+        self.buffer.append(kakuro)
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+        return True
+
+    # one ID reservation and one index and hash file update for the whole buffer
+    # the hashes are checked and registered under the lock of the hash file, see FileGrid.registerHashes(),
+    # grids written meanwhile by another process in the same directory are dropped
+    def flush(self):
+        registered = set(self.filegrid.registerHashes([kakuro.problem_hash() for kakuro in self.buffer]))
+        kakuros = [kakuro for kakuro in self.buffer if kakuro.problem_hash() in registered]
+        self.duplicates += len(self.buffer) - len(kakuros)
+        if kakuros:
+            self.filegrid.writeGrids(self.filegrid.createGridIDs(len(kakuros)), kakuros, registered=True)
+        self.written += len(kakuros)
+        self.buffer = []
+        self.hashes = set()
+
+def qsize(queue):
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        # not available on macOS
+        return -1
+
+def progress(elapsed, generated, verified, accepted, rejected, gridq, verdictq):
+    rejects = " ".join("{} {}".format(reason, n) for reason, n in sorted(rejected.items()))
+    return "\r{:6.1f} s | generated {} ({:.1f}/s) | verified {} | accepted {} ({:.1f}/s) | rejected {} | queues {}/{}  ".format(
+        elapsed, generated, generated / elapsed, verified, accepted, accepted / elapsed,
+        rejects or 0, qsize(gridq), qsize(verdictq))
+
+# returns the number of grids written
+def run(options):
+    filegrid = FileGrid(griddir=options.directory)
+    writer = PipelineWriter(filegrid, options.flush)
+    stop = multiprocessing.Event()
+    generated = multiprocessing.Value('q', 0)
+    gridq = multiprocessing.Queue(options.queue)
+    verdictq = multiprocessing.Queue(options.queue)
+
+    master = random.Random(options.seed)
+    workers = [multiprocessing.Process(target=generate_stage,
+                                       args=(options, master.getrandbits(64), gridq, generated, stop))
+               for _ in range(options.gen_workers)]
+    workers += [multiprocessing.Process(target=verify_stage, args=(options, gridq, verdictq, stop))
+                for _ in range(options.solve_workers)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    start = time.perf_counter()
+    lastdisplay = 0.0
+    verified = 0
+    rejected = {}
+    try:
+        while writer.count() < options.grids:
+            try:
+                verdict, value, rating = verdictq.get(timeout=POLL)
+                verified += 1
+                if verdict == "accept":
+                    if not writer.add(decode(value)):
+                        rejected["duplicate"] = rejected.get("duplicate", 0) + 1
+                else:
+                    rejected[value] = rejected.get(value, 0) + 1
+            except Empty:
+                pass
+            elapsed = time.perf_counter() - start
+            if not options.quiet and elapsed - lastdisplay >= 0.5:
+                lastdisplay = elapsed
+                sys.stderr.write(progress(elapsed, generated.value, verified, writer.count(), rejected, gridq, verdictq))
+                sys.stderr.flush()
+    finally:
+        stop.set()
+        writer.flush()
+        for worker in workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+    elapsed = time.perf_counter() - start
+    if not options.quiet:
+        sys.stderr.write(progress(elapsed, generated.value, verified, writer.count(), rejected, gridq, verdictq) + "\n")
+    print("{} grids written to {} in {:.2f} s, {:.1f} grids/s".format(
+        writer.written, options.directory, elapsed, writer.written / elapsed if elapsed else 0))
+    return writer.written
+
+if __name__ == '__main__':
+    cpus = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description="Generate, verify and write kakuro puzzles in a pipeline")
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=10)
+    parser.add_argument("-g","--grids",help="Number of grids to write",type=int, default=10)
+    parser.add_argument("-d","--directory",help="directory where puzzles are written",default="grids")
+    parser.add_argument("-b","--bcells",help="Black cell density",type=float, default=0.4)
+    parser.add_argument("-u","--unique",action='store_true',help="only keep puzzles with a unique solution")
+    parser.add_argument("--solver",help="solver of the uniqueness check, auto is propagation",choices=["auto"]+BACKENDS,default="auto")
+    parser.add_argument("--improve",action='store_true',help="with -u, change grids with several solutions until they are unique")
+    parser.add_argument("--difficulty",help="only keep puzzles of these difficulty levels",nargs='+',choices=LEVELS)
+    parser.add_argument("--strategy",help="fill strategy, construct implies --layouts",choices=["repair","construct"],default="repair")
+    parser.add_argument("-l","--layouts",action='store_true',help="take valid black cells layouts from a pool")
+    parser.add_argument("--symmetric",action='store_true',help="layouts with a rotational symmetry, implies --layouts")
+    parser.add_argument("--gen-workers",help="generator processes",type=int, default=max(1, cpus // 4))
+    parser.add_argument("--solve-workers",help="verifier processes",type=int, default=max(1, cpus - max(1, cpus // 4)))
+    parser.add_argument("--queue",help="size of the queues between the stages",type=int, default=256)
+    parser.add_argument("--flush",help="grids written at once",type=int, default=100)
+    parser.add_argument("--seed",help="Seed of the generators, the order of the grids still depends on the scheduling",type=int)
+    parser.add_argument("-q","--quiet",action='store_true',help="no progress display")
+    options = parser.parse_args()
+    options.directory = options.directory.replace("/","")
+    run(options)
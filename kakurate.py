@@ -0,0 +1,139 @@
+from kakugrid import KakuroGrid
+from kakusolver import KakuroSolver, POPCOUNT
+from kakudata import DATA
+import sys
+
+# Difficulty rating of a kakuro problem
+# the problem is solved the way a player would, with techniques of increasing difficulty
+# the easiest technique that makes progress is always used first:
+#  0 - unique combination : a zone with a single possible combination restricts its cells to its digits,
+#                           a placed digit is removed from the other cells of its zones
+#  1 - crossing zones     : a cell keeps the digits allowed by the combinations of both its zones
+#  2 - sum elimination    : a combination is dropped when the candidates of the cells cannot make it,
+#                           a digit is kept only if the cell can hold it in one of the remaining combinations
+#  3 - search             : trial and error, when the other techniques are stuck
+# the score adds the weight of each technique every time it makes progress
+# and the weight of search for each node explored
+TECHNIQUES = ["unique combination", "crossing zones", "sum elimination", "search"]
+WEIGHTS = [1, 3, 10, 50]
+# difficulty level given by the hardest technique needed
+LEVELS = ["easy", "medium", "hard", "expert"]
+
+class KakuroRater:
+    def __init__(self, kakuro):
+        self.solver = KakuroSolver(kakuro)
+        self.runs = self.solver.runs
+        self.combos = self.solver.combos
+        self.runsum = self.solver.runsum
+
+    # digits placed in a zone
+    def placed(self, cand, cells):
+        fixed = 0
+        for i in cells:
+            m = cand[i]
+            if m & (m-1) == 0:
+                fixed |= m
+        return fixed
+
+    # restrict the free cells of a zone to mask and remove the placed digits
+    # returns -1 on a contradiction, else the number of changed cells
+    def restrict(self, cand, cells, mask, fixed):
+        changed = 0
+        for i in cells:
+            m = cand[i]
+            if m & (m-1) == 0:
+                continue
+            nm = m & mask & ~fixed
+            if nm != m:
+                if nm == 0:
+                    return -1
+                cand[i] = nm
+                changed += 1
+        return changed
+
+    def unique_combination(self, cand):
+        progress = False
+        for run, cells in enumerate(self.runs):
+            fixed = self.placed(cand, cells)
+            valid = [combo for combo in self.combos[run] if combo & fixed == fixed]
+            mask = valid[0] if len(valid) == 1 else 0x1FF
+            changed = self.restrict(cand, cells, mask, fixed)
+            if changed < 0:
+                return None
+            progress = progress or changed > 0
+        return progress
+
+    def crossing_zones(self, cand):
+        progress = False
+        for run, cells in enumerate(self.runs):
+            fixed = self.placed(cand, cells)
+            mask = DATA.allowed_digits(self.runsum[run], len(cells), fixed)
+            changed = self.restrict(cand, cells, mask, fixed)
+            if changed < 0:
+                return None
+            progress = progress or changed > 0
+        return progress
+
+    def sum_elimination(self, cand):
+        before = list(cand)
+        self.solver.reset_stats()
+        self.solver.weight = [1] * len(self.runs)
+        if not self.solver.propagate(cand, range(len(self.runs))):
+            return None
+        return cand != before
+
+    def solved(self, cand):
+        for i in self.solver.cells:
+            if POPCOUNT[cand[i]] != 1:
+                return False
+        return True
+
+    # returns (score, hardest, counts)
+    #  - score   : difficulty score, higher is harder
+    #  - hardest : index in TECHNIQUES of the hardest technique needed, -1 if the problem cannot be rated:
+    #              no solution, several solutions or no zone at all
+    #  - counts  : number of times each technique made progress, search counts the nodes explored
+    def rate(self):
+        techniques = [self.unique_combination, self.crossing_zones, self.sum_elimination]
+        counts = [0] * len(TECHNIQUES)
+        hardest = 0
+        if not self.runs:
+            return 0, -1, counts
+        cand = self.solver.start()
+        while not self.solved(cand):
+            for level, technique in enumerate(techniques):
+                progress = technique(cand)
+                if progress is None:
+                    return 0, -1, counts
+                if progress:
+                    counts[level] += 1
+                    hardest = max(hardest, level)
+                    break
+            else:
+                # stuck, finish with a search from the current candidates
+                # a problem with several solutions always gets here, the techniques only make sound deductions
+                if len(self.solver.run(2, cand)) != 1:
+                    return 0, -1, counts
+                counts[3] = self.solver.stats["nodes"]
+                hardest = 3
+                break
+        score = sum(w*c for w, c in zip(WEIGHTS, counts))
+        return score, hardest, counts
+
+    # difficulty level, one of LEVELS, None if the problem cannot be rated
+    def level(self):
+        _, hardest, _ = self.rate()
+        return LEVELS[hardest] if hardest >= 0 else None
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        kakuro = KakuroGrid(fpath=sys.argv[1])
+    else:
+        kakuro = KakuroGrid(10,maxattempts=10,bcells=0.4)
+        while not kakuro.fill():
+            kakuro = KakuroGrid(10,maxattempts=10,bcells=0.4)
+    score, hardest, counts = KakuroRater(kakuro).rate()
+    print(kakuro.serialize_problem())
+    print("score", score, "hardest", TECHNIQUES[hardest] if hardest >= 0 else "not rateable",
+          "level", LEVELS[hardest] if hardest >= 0 else None)
+    print(dict(zip(TECHNIQUES, counts)))
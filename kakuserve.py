@@ -0,0 +1,241 @@
+from kakugen import generate_grid, GridTask
+from kakurate import LEVELS
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import collections
+import argparse
+import asyncio
+import json
+import time
+import sys
+
+# Puzzle server
+# puzzles are kept in memory in one pool per (size, difficulty) and served in a few microseconds
+# a pool going below the low watermark is refilled up to the high watermark in the background,
+# the grids are generated by generate_grid() in worker processes
+#
+# protocol : one JSON object per line, over a Unix socket or stdin/stdout
+#  {"op": "get", "size": 10, "difficulty": "easy"}  -> {"ok": true, "puzzle": {...}, "source": "pool"}
+#      difficulty is optional, one of kakurate.LEVELS, only puzzles with a unique solution have one
+#  {"op": "metrics"}                                -> {"ok": true, "metrics": {...}}
+#  {"op": "fill", "size": 10, "difficulty": "easy"} -> starts the refill of a pool
+# errors are answered with {"ok": false, "error": "..."}
+# each request line is handled in its own task, a request waiting for a generation does not hold back
+# the requests read after it, the answers are still written in the order of the requests
+# puzzles have a unique solution unless the server is started with --ambiguous, a grid with several
+# solutions is changed by UniqueImprover instead of being dropped, the filler alone almost never gives one
+
+# number of latencies kept to compute the percentiles
+LATENCIES = 10000
+MINSIZE = 3
+MAXSIZE = 60
+
+# generate_grid() prints its progress, workers must not write in the stdout used by the protocol
+def quiet_worker():
+    sys.stdout = sys.stderr
+
+class PuzzleServer:
+    def __init__(self, workers=2, low=4, high=16, bcells=0.4, unique=True, strategy="repair"):
+        self.low = low
+        self.high = high
+        self.bcells = bcells
+        self.unique = unique
+        self.strategy = strategy
+        # workers are spawned, forking would copy the thread reading stdin
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=quiet_worker)
+        self.workers = workers
+        # (size, level) -> deque of puzzles, level None for any difficulty
+        self.pools = {}
+        # (size, level) -> refill task
+        self.refills = {}
+        self.latencies = collections.deque(maxlen=LATENCIES)
+        self.counters = collections.Counter()
+        self.gentime = 0.0
+
+    def poolname(self, key):
+        size, level = key
+        return "{}/{}".format(size, level or "any")
+
+    # one grid in a worker process, returned as a JSON ready dict
+    async def generate(self, key):
+        size, level = key
+        levels = [level] if level else None
+        task = GridTask(size, self.bcells, self.unique, rate=True, levels=levels, strategy=self.strategy,
+                        backend="propagation", improve=True)
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        kakuro, _, rating, _ = await loop.run_in_executor(self.executor, generate_grid, task)
+        self.gentime += time.perf_counter() - start
+        self.counters["generated"] += 1
+        score, hardest, _ = rating
+        return {"size": size, "level": LEVELS[hardest] if hardest >= 0 else None, "score": score,
+                "problem": kakuro.serialize_problem(), "solution": kakuro.serialize_solution()}
+
+    # generate grids up to the high watermark, workers grids at a time
+    async def refill(self, key):
+        pool = self.pools[key]
+        try:
+            while len(pool) < self.high:
+                count = min(self.high - len(pool), self.workers)
+                puzzles = await asyncio.gather(*[self.generate(key) for _ in range(count)])
+                pool.extend(puzzles)
+        finally:
+            del self.refills[key]
+
+    def check_refill(self, key):
+        pool = self.pools.setdefault(key, collections.deque())
+        if len(pool) < self.low and key not in self.refills:
+            self.counters["refills"] += 1
+            self.refills[key] = asyncio.create_task(self.refill(key))
+
+    async def get(self, size, level):
+        key = (size, level)
+        pool = self.pools.setdefault(key, collections.deque())
+        if pool:
+            puzzle = pool.popleft()
+            source = "pool"
+        else:
+            puzzle = await self.generate(key)
+            source = "generated"
+        self.counters["served " + source] += 1
+        self.check_refill(key)
+        return {"ok": True, "puzzle": puzzle, "source": source}
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies)-1, int(p * len(latencies)))] * 1000
+        return {
+            "pools": {self.poolname(key): len(pool) for key, pool in self.pools.items()},
+            "refilling": [self.poolname(key) for key in self.refills],
+            "watermarks": [self.low, self.high],
+            "counters": dict(self.counters),
+            "generation_ms_mean": self.gentime * 1000 / self.counters["generated"] if self.counters["generated"] else 0.0,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+                           "max": latencies[-1] * 1000 if latencies else 0.0},
+        }
+
+    def parse_key(self, request):
+        size = request.get("size", 10)
+        level = request.get("difficulty")
+        if not isinstance(size, int) or size < MINSIZE or size > MAXSIZE:
+            raise Exception("Invalid size ", size)
+        if level is not None and level not in LEVELS:
+            raise Exception("Invalid difficulty ", level)
+        if level is not None and not self.unique:
+            raise Exception("Puzzles with several solutions have no difficulty ", level)
+        return size, level
+
+    # answer one request line, returns the answer line
+    async def handle(self, line):
+        start = time.perf_counter()
+        self.counters["requests"] += 1
+        try:
+            request = json.loads(line)
+            op = request.get("op", "get")
+            if op == "get":
+                answer = await self.get(*self.parse_key(request))
+            elif op == "fill":
+                self.check_refill(self.parse_key(request))
+                answer = {"ok": True}
+            elif op == "metrics":
+                answer = {"ok": True, "metrics": self.metrics()}
+            else:
+                raise Exception("Unknown op ", op)
+        except Exception as e:
+            self.counters["errors"] += 1
+            answer = {"ok": False, "error": "".join(str(arg) for arg in e.args) if e.args else repr(e)}
+        self.latencies.append(time.perf_counter() - start)
+        return json.dumps(answer) + "\n"
+
+    # write the answers of the handle() tasks of answers in their order, until None
+    async def send_answers(self, answers, write):
+        while True:
+            task = await answers.get()
+            if task is None:
+                return
+            await write(await task)
+
+    async def serve_client(self, reader, writer):
+        answers = asyncio.Queue()
+        async def write(answer):
+            writer.write(answer.encode())
+            await writer.drain()
+        sender = asyncio.create_task(self.send_answers(answers, write))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                answers.put_nowait(asyncio.create_task(self.handle(line)))
+            answers.put_nowait(None)
+            await sender
+        finally:
+            sender.cancel()
+            writer.close()
+
+    async def serve_socket(self, path):
+        server = await asyncio.start_unix_server(self.serve_client, path=path)
+        async with server:
+            await server.serve_forever()
+
+    # requests are read from stdin until end of file
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        answers = asyncio.Queue()
+        async def write(answer):
+            sys.stdout.write(answer)
+            sys.stdout.flush()
+        sender = asyncio.create_task(self.send_answers(answers, write))
+        try:
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                answers.put_nowait(asyncio.create_task(self.handle(line)))
+            answers.put_nowait(None)
+            await sender
+        finally:
+            sender.cancel()
+
+    def close(self):
+        for task in self.refills.values():
+            task.cancel()
+        self.executor.shutdown(cancel_futures=True)
+
+async def main(args):
+    server = PuzzleServer(args.jobs, args.low, args.high, args.bcells, not args.ambiguous, args.strategy)
+    # pools filled at startup, e.g. 10 or 10:easy
+    for spec in args.pool:
+        size, _, level = spec.partition(":")
+        server.check_refill(server.parse_key({"size": int(size), "difficulty": level or None}))
+    try:
+        if args.socket:
+            await server.serve_socket(args.socket)
+        else:
+            await server.serve_stdio()
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve kakuro puzzles from in-memory pools")
+    parser.add_argument("--socket",help="Unix socket path, stdin/stdout if not given")
+    parser.add_argument("-p","--pool",help="pools to fill at startup, SIZE or SIZE:DIFFICULTY",nargs='*',default=[])
+    parser.add_argument("-j","--jobs",help="Number of worker processes",type=int, default=2)
+    parser.add_argument("--low",help="refill a pool when it has fewer puzzles",type=int, default=4)
+    parser.add_argument("--high",help="refill a pool up to this number of puzzles",type=int, default=16)
+    parser.add_argument("--bcells",help="Black cell density",type=float, default=0.4)
+    parser.add_argument("--ambiguous",action='store_true',help="also serve puzzles with several solutions, they have no difficulty")
+    parser.add_argument("--strategy",help="fill strategy, construct fills valid layouts from kakulayout",choices=["repair","construct"],default="repair")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
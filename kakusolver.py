@@ -0,0 +1,316 @@
+from kakugrid import KakuroGrid, WHITE
+from kakudata import DATA
+import random
+import time
+import sys
+
+# digit d is stored as bit (d-1) of a candidate mask
+ALLDIGITS = 0x1FF
+POPCOUNT = [bin(m).count("1") for m in range(ALLDIGITS+1)]
+# digit of a mask containing a single bit
+DIGIT = {1 << (d-1): d for d in range(1,10)}
+
+# digits each cell can take in at least one assignment giving a different digit to every cell
+#  - masks : candidates of the cells of a zone, restricted to one combination
+#            there are as many cells as digits in the combination
+# returns a tuple of masks, None if no assignment exists
+# the results are cached, the same zones come back again and again during the search
+SUPPORTS = {}
+def supports(masks):
+    found = SUPPORTS.get(masks, 0)
+    if found != 0:
+        return found
+    if len(SUPPORTS) > 200000:
+        SUPPORTS.clear()
+
+    n = len(masks)
+    # a first assignment built with augmenting paths
+    match = [0] * n
+    owner = {}
+    def augment(i, seen):
+        m = masks[i] & ~seen[0]
+        while m:
+            bit = m & -m
+            m ^= bit
+            seen[0] |= bit
+            j = owner.get(bit, -1)
+            if j < 0 or augment(j, seen):
+                owner[bit] = i
+                match[i] = bit
+                return True
+        return False
+    for i in range(n):
+        if not augment(i, [0]):
+            SUPPORTS[masks] = None
+            return None
+
+    # cell i can take digit d if the cell owning d can reach the digit of i
+    # by following the other candidates and the cells owning them, without i
+    result = []
+    for i in range(n):
+        sup = match[i]
+        others = masks[i] & ~sup
+        while others:
+            bit = others & -others
+            others ^= bit
+            j = owner[bit]
+            seencells = (1 << i) | (1 << j)
+            reach = masks[j] & ~bit
+            while True:
+                if reach & match[i]:
+                    sup |= bit
+                    break
+                grow = 0
+                m = reach
+                while m:
+                    b = m & -m
+                    m ^= b
+                    k = owner[b]
+                    if not seencells >> k & 1:
+                        seencells |= 1 << k
+                        grow |= masks[k]
+                if not grow & ~reach:
+                    break
+                reach |= grow
+        result.append(sup)
+    result = tuple(result)
+    SUPPORTS[masks] = result
+    return result
+
+class Restart(Exception):
+    pass
+
+# Solve a kakuro problem without any external tool
+# each white cell holds a 9 bit mask of its candidates
+# constraint propagation on the zones uses the (sum, length) combinations of KakuroData,
+# when propagation is stuck we branch on the cell with the fewest candidates
+# the search restarts with a larger node budget when it gets lost in a dead branch
+class KakuroSolver:
+    # nodes explored before the first restart, the budget grows by RESTART_GROWTH on each restart
+    RESTART_NODES = 100
+    RESTART_GROWTH = 1.5
+
+    def __init__(self, kakuro, seed=0):
+        self.kakuro = kakuro
+        self.seed = seed
+        if kakuro.runs is None:
+            kakuro.build_runs()
+        self.N = kakuro.N
+        self.runs = kakuro.runs
+        self.hrun = kakuro.hrun
+        self.vrun = kakuro.vrun
+        self.cells = [i for i in range(self.N*self.N) if kakuro.kind[i] == WHITE]
+
+        # clue and allowed combinations of each zone
+        self.runsum = []
+        self.combos = []
+        for run, cells in enumerate(self.runs):
+            clues = kakuro.vclues if kakuro.runvertical[run] else kakuro.hclues
+            total = clues[kakuro.runclue[run]]
+            self.runsum.append(total)
+            self.combos.append(DATA.get_combinations(total,len(cells)))
+
+        self.stats = {}
+
+    # initial candidates, before any propagation
+    def start(self):
+        cand = [0] * (self.N*self.N)
+        for i in self.cells:
+            cand[i] = ALLDIGITS
+        return cand
+
+    # remove the candidates that cannot satisfy the zones in queue
+    # every zone containing a modified cell is checked again
+    # returns False if a contradiction is found
+    #  - changes : list extended with the cells whose candidates were reduced
+    def propagate(self, cand, queue, changes=None):
+        runs = self.runs
+        combos = self.combos
+        hrun = self.hrun
+        vrun = self.vrun
+        inqueue = set(queue)
+        queue = list(inqueue)
+        while queue:
+            run = queue.pop()
+            inqueue.discard(run)
+            self.stats["propagations"] += 1
+            cells = runs[run]
+
+            # digits already placed in the zone
+            fixed = 0
+            for i in cells:
+                m = cand[i]
+                if m & (m-1) == 0:
+                    fixed |= m
+
+            # digits each cell can take with one of the combinations containing the placed digits
+            allowed = [0] * len(cells)
+            for combo in combos[run]:
+                if combo & fixed != fixed:
+                    continue
+                sup = supports(tuple([cand[i] & combo for i in cells]))
+                if sup is not None:
+                    for k in range(len(cells)):
+                        allowed[k] |= sup[k]
+
+            changed = []
+            for k, i in enumerate(cells):
+                m = cand[i]
+                nm = m & allowed[k]
+                if nm != m:
+                    if nm == 0:
+                        return self.conflict(run)
+                    cand[i] = nm
+                    changed.append(i)
+            if changes is not None:
+                changes.extend(changed)
+
+            for i in changed:
+                for r in (hrun[i], vrun[i]):
+                    if r >= 0 and r not in inqueue:
+                        inqueue.add(r)
+                        queue.append(r)
+        return True
+
+    # a zone cannot be satisfied, it gets more weight when choosing the next cell
+    def conflict(self, run):
+        self.weight[run] += 1
+        return False
+
+    # next cell to branch on, -1 if all cells are solved
+    # fewest candidates first, ties are broken by the weight of the zones of the cell
+    # so that the search focuses on the zones that failed the most
+    # a little noise makes each restart explore a different tree
+    def choose(self, cand):
+        weight = self.weight
+        hrun = self.hrun
+        vrun = self.vrun
+        rnd = self.rnd.random
+        best = -1
+        bestscore = 10.0
+        for i in self.cells:
+            count = POPCOUNT[cand[i]]
+            if count > 1:
+                w = 0
+                if hrun[i] >= 0:
+                    w += weight[hrun[i]]
+                if vrun[i] >= 0:
+                    w += weight[vrun[i]]
+                score = count / w * (1.0 + 0.01 * rnd())
+                if score < bestscore:
+                    best = i
+                    bestscore = score
+        return best
+
+    # depth first search, calls found(cand) for each solution
+    # stops when found returns True
+    # raises Restart when the node budget is exhausted
+    def search(self, cand, found):
+        self.stats["nodes"] += 1
+        if self.stats["nodes"] > self.budget:
+            raise Restart()
+        i = self.choose(cand)
+        if i < 0:
+            return found(cand)
+        m = cand[i]
+        while m:
+            bit = m & -m
+            m ^= bit
+            child = list(cand)
+            child[i] = bit
+            queue = [r for r in (self.hrun[i], self.vrun[i]) if r >= 0]
+            if self.propagate(child, queue):
+                if self.search(child, found):
+                    return True
+            self.stats["backtracks"] += 1
+        return False
+
+    def reset_stats(self):
+        self.stats = {"nodes": 0, "backtracks": 0, "propagations": 0, "restarts": 0, "solutions": 0, "time": 0.0}
+
+    # returns the list of the solutions found, at most limit
+    # the solutions found before a restart are kept, the search ends when a tree is fully explored
+    #  - cand : candidates to start from, e.g. a partially solved grid, start() if None
+    def run(self, limit, cand=None):
+        self.reset_stats()
+        self.weight = [1] * len(self.runs)
+        self.rnd = random.Random(self.seed)
+        start = time.perf_counter()
+        solutions = {}
+
+        def found(cand):
+            solutions[tuple(cand)] = True
+            self.stats["solutions"] = len(solutions)
+            return len(solutions) >= limit
+
+        cand = self.start() if cand is None else list(cand)
+        if self.propagate(cand, range(len(self.runs))):
+            nodes = self.RESTART_NODES
+            while True:
+                self.budget = self.stats["nodes"] + nodes
+                try:
+                    self.search(cand, found)
+                    break
+                except Restart:
+                    self.stats["restarts"] += 1
+                    nodes = int(nodes * self.RESTART_GROWTH)
+        self.stats["time"] = time.perf_counter() - start
+        return list(solutions)
+
+    # builds a grid holding the digits of a solution
+    def make_grid(self, cand):
+        grid = self.kakuro.copy()
+        for i in self.cells:
+            grid.digits[i] = DIGIT[cand[i]]
+        return grid
+
+    # solve the problem
+    # returns (solution, stats)
+    #  - solution : a KakuroGrid holding the digits, None if there is no solution
+    #  - stats : nodes, backtracks, propagations, solutions, time in seconds
+    def solve(self):
+        solutions = self.run(1)
+        if not solutions:
+            return None, self.stats
+        return self.make_grid(solutions[0]), self.stats
+
+    # number of solutions of the problem, the search stops when limit solutions are found
+    # count_solutions(limit=2) == 1 proves that the solution is unique
+    def count_solutions(self, limit=2):
+        return len(self.run(limit))
+
+    def is_unique(self):
+        return self.count_solutions(limit=2) == 1
+
+# solving backends, same interface: run(), solve(), count_solutions(), is_unique() and stats
+#  - "propagation" : KakuroSolver
+#  - "dlx"         : kakudlx.DLXSolver, exact cover with Dancing Links
+BACKENDS = ["propagation", "dlx"]
+# "auto" uses propagation at every size, measured with kakubench.py --solvers -a 300, bcells 0.4:
+# dlx has a slightly lower mean up to size 12 (22 ms against 28 ms at size 10) but a much longer worst case,
+# even with its fallback to propagation (max 1.0 s against 0.3 s at size 8), and is slower from size 14
+def make_solver(kakuro, backend="auto", seed=0):
+    if backend == "auto":
+        backend = "propagation"
+    if backend == "propagation":
+        return KakuroSolver(kakuro, seed)
+    if backend == "dlx":
+        # kakudlx imports this module
+        from kakudlx import DLXSolver
+        return DLXSolver(kakuro, seed)
+    raise Exception("Unknown solver backend ", backend)
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    kakuro = KakuroGrid(size,maxattempts=10,bcells=0.4)
+    while not kakuro.fill():
+        kakuro = KakuroGrid(size,maxattempts=10,bcells=0.4)
+    print(kakuro.serialize_problem())
+    solution, stats = KakuroSolver(kakuro).solve()
+    if solution is None:
+        print("no solution")
+    else:
+        print(solution.serialize_solution())
+    print(stats)
+    solver = KakuroSolver(kakuro)
+    print("unique" if solver.is_unique() else "several solutions", solver.stats)
@@ -0,0 +1,219 @@
+from kakugrid import KakuroGrid, WHITE, BLACK, construct_search
+from kakulayout import make_layout
+from kakufile import FileGrid
+from array import array
+import argparse
+import bisect
+import random
+import time
+
+# Sparse model for very large grids
+# only the white cells and the zones are stored, black cells are implicit
+#  - cells[k]      : flat index r*N+c of white cell k, sorted, k is the cell ID
+#  - digits[k]     : digit of cell k
+#  - hrun[k], vrun[k] : horizontal and vertical zone of cell k, -1 if none
+#  - zone z has the cell IDs runcells[runstart[z]:runstart[z+1]]
+#  - runclue[z]    : flat index of the black cell holding the clue of zone z
+#  - runvertical[z]: 1 for a vertical zone, 0 for a horizontal one
+#  - runsum[z]     : clue of zone z, set by fill_clues()
+# memory and the work of fill(), fill_clues() and of the zone index are proportional
+# to the number of white cells, the text formats still have one token per cell
+class SparseGrid:
+    def __init__(self, N, white, maxattempts=5, seed=None, rng=None):
+        self.N = N
+        self.maxattempts = maxattempts
+        self.rng = rng if rng is not None else random.Random(seed)
+        self.cells = array('i', sorted(white))
+        self.digits = array('b', bytes(len(self.cells)))
+        self.runsum = None
+        self.build_runs()
+
+    # sparse copy of a KakuroGrid, digits included
+    @classmethod
+    def from_grid(cls, kakuro):
+        N = kakuro.N
+        white = [i for i in range(N*N) if kakuro.kind[i] == WHITE]
+        grid = cls(N, white, kakuro.maxattempts, rng=kakuro.rng)
+        for k, i in enumerate(grid.cells):
+            grid.digits[k] = kakuro.digits[i]
+        return grid
+
+    # grid with a layout from kakulayout, no zone longer than 9 cells
+    @classmethod
+    def random_layout(cls, N, bcells=0.3, symmetric=False, maxattempts=5, seed=None, rng=None):
+        rng = rng if rng is not None else random.Random(seed)
+        layout = make_layout(N, bcells, rng, symmetric)
+        return cls(N, [i for i in range(N*N) if layout[i] == WHITE], maxattempts, rng=rng)
+
+    def __len__(self):
+        return len(self.cells)
+
+    # ID of the white cell at flat index i, -1 for a black cell
+    def cell_id(self, i):
+        k = bisect.bisect_left(self.cells, i)
+        if k < len(self.cells) and self.cells[k] == i:
+            return k
+        return -1
+
+    def run_cells(self, run):
+        return self.runcells[self.runstart[run]:self.runstart[run+1]]
+
+    # zones are found from their first cell, the cell before it is black
+    # vertical zones come first, as in KakuroGrid.build_runs()
+    def build_runs(self):
+        N = self.N
+        n = len(self.cells)
+        index = {i: k for k, i in enumerate(self.cells)}
+        self.hrun = array('i', [-1]) * n
+        self.vrun = array('i', [-1]) * n
+        self.runstart = array('i', [0])
+        self.runcells = array('i')
+        self.runclue = array('i')
+        self.runvertical = array('b')
+        # the left column is black, a horizontal zone never goes on the next row
+        for vertical, step, cellrun in ((1, N, self.vrun), (0, 1, self.hrun)):
+            for k, i in enumerate(self.cells):
+                if i - step in index:
+                    continue
+                zone = [k]
+                j = i + step
+                while j in index:
+                    zone.append(index[j])
+                    j = j + step
+                if len(zone) < 2:
+                    continue
+                run = len(self.runclue)
+                for m in zone:
+                    cellrun[m] = run
+                self.runcells.extend(zone)
+                self.runstart.append(len(self.runcells))
+                self.runclue.append(i - step)
+                self.runvertical.append(vertical)
+
+    # fill the white cells with construct_search(), see KakuroGrid.construct_grid()
+    # returns False if a zone is too long or if every search failed
+    def fill(self):
+        nruns = len(self.runclue)
+        runs = [self.run_cells(run) for run in range(nruns)]
+        for cells in runs:
+            if len(cells) > 9:
+                return False
+        white = range(len(self.cells))
+        zones = [tuple(run for run in (self.hrun[k], self.vrun[k]) if run >= 0) for k in white]
+        budget = 2 * len(self.cells)
+        for attempt in range(self.maxattempts):
+            if construct_search(white, zones, runs, self.digits, self.rng, budget):
+                self.fill_clues()
+                return True
+            budget = budget * 2
+        return False
+
+    def fill_clues(self):
+        digits = self.digits
+        runcells = self.runcells
+        runstart = self.runstart
+        self.runsum = array('h', [sum(digits[k] for k in runcells[runstart[run]:runstart[run+1]])
+                                  for run in range(len(self.runclue))])
+
+    # clue cells of each direction, flat index -> clue
+    def clue_cells(self):
+        hclues = {}
+        vclues = {}
+        for run in range(len(self.runclue)):
+            clues = vclues if self.runvertical[run] else hclues
+            clues[self.runclue[run]] = self.runsum[run]
+        return hclues, vclues
+
+    # same text as KakuroGrid.serialize_problem()
+    def serialize_problem(self):
+        N = self.N
+        hlines = [["B"] * N for _ in range(N)]
+        vlines = [["B"] * N for _ in range(N)]
+        for i in self.cells:
+            r, c = divmod(i, N)
+            hlines[r][c] = "."
+            vlines[c][r] = "."
+        hclues, vclues = self.clue_cells()
+        for i, clue in hclues.items():
+            r, c = divmod(i, N)
+            hlines[r][c] = str(clue)
+        for i, clue in vclues.items():
+            r, c = divmod(i, N)
+            vlines[c][r] = str(clue)
+        pb = ["(solve " + str(N) + "\n"]
+        for r in range(1, N):
+            line = " ".join(hlines[r]) + " "
+            if r == N-1:
+                line = line + "/"
+            pb.append(line + "/\n\n")
+        for c in range(1, N):
+            line = " ".join(vlines[c]) + " "
+            if c == N-1:
+                line = line + "/"
+            pb.append(line + "/\n")
+        pb.append(")\n\n")
+        return "".join(pb)
+
+    # same text as KakuroGrid.serialize_solution()
+    def serialize_solution(self):
+        N = self.N
+        rows = [["{:>8}".format("B/B")] * N for _ in range(N)]
+        for k, i in enumerate(self.cells):
+            r, c = divmod(i, N)
+            rows[r][c] = "{:>8}".format(self.digits[k])
+        hclues, vclues = self.clue_cells()
+        for i in set(hclues) | set(vclues):
+            h = hclues.get(i)
+            v = vclues.get(i)
+            r, c = divmod(i, N)
+            rows[r][c] = "{:>8}".format(("H"+str(h) if h else "B") + "/" + ("V"+str(v) if v else "B"))
+        return "".join("".join(row) + "\n" for row in rows) + "\n\n"
+
+    # dense KakuroGrid with the same cells, digits and clues
+    def to_grid(self):
+        N = self.N
+        kind = array('b', [BLACK]) * (N*N)
+        digits = array('b', bytes(N*N))
+        hclues = array('b', bytes(N*N))
+        vclues = array('b', bytes(N*N))
+        for k, i in enumerate(self.cells):
+            kind[i] = WHITE
+            digits[i] = self.digits[k]
+        if self.runsum is not None:
+            hc, vc = self.clue_cells()
+            for i, clue in hc.items():
+                hclues[i] = clue
+            for i, clue in vc.items():
+                vclues[i] = clue
+        return KakuroGrid.from_planes(N, kind, digits, hclues, vclues)
+
+    # bytes used by the arrays of the grid
+    def nbytes(self):
+        arrays = [self.cells, self.digits, self.hrun, self.vrun, self.runstart, self.runcells,
+                  self.runclue, self.runvertical]
+        if self.runsum is not None:
+            arrays.append(self.runsum)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a very large kakuro puzzle with the sparse model")
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=100)
+    parser.add_argument("-b","--bcells",help="Black cell density",type=float, default=0.3)
+    parser.add_argument("--symmetric",action='store_true',help="rotational symmetry")
+    parser.add_argument("--seed",help="Seed of the random generator",type=int)
+    parser.add_argument("-d","--directory",help="write the puzzle in this directory")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    grid = SparseGrid.random_layout(args.size, args.bcells, args.symmetric, maxattempts=10, seed=args.seed)
+    layout = time.perf_counter()
+    ok = grid.fill()
+    filled = time.perf_counter()
+    print("{}x{}: {} white cells, {} zones, {} bytes".format(args.size, args.size, len(grid), len(grid.runclue), grid.nbytes()))
+    print("layout {:.2f} s, fill {:.2f} s, {}".format(layout - start, filled - layout, "OK" if ok else "KO"))
+    if ok and args.directory:
+        filegrid = FileGrid(griddir=args.directory)
+        gridpath = filegrid.createNewFile()
+        filegrid.write(grid.serialize_problem())
+        filegrid.writeSolution(grid.serialize_solution())
+        print("grid created " + gridpath)
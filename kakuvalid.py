@@ -0,0 +1,154 @@
+from kakugrid import KakuroGrid, WHITE
+import argparse
+import random
+import time
+try:
+    import numpy as np
+except ImportError:
+    # only check_batch() needs numpy
+    np = None
+
+# Check answers submitted for a puzzle
+# an answer gives the digits of the grid as N*N values in row-major order, like the digits plane of
+# KakuroGrid: bytes, array, list or a string of N*N characters, black cells are ignored
+# an answer is valid when
+#  - every white cell holds a digit from 1 to 9
+#  - a zone holds each digit at most once
+#  - the digits of a zone add up to its clue
+class SolutionChecker:
+    def __init__(self, kakuro):
+        if kakuro.runs is None:
+            kakuro.build_runs()
+        self.N = kakuro.N
+        self.runs = kakuro.runs
+        # clue of each zone
+        self.clues = []
+        for run in range(len(self.runs)):
+            clues = kakuro.vclues if kakuro.runvertical[run] else kakuro.hclues
+            self.clues.append(clues[kakuro.runclue[run]])
+        # white cells outside of any zone, only their digit range is checked
+        self.lone = [i for i in range(self.N*self.N)
+                     if kakuro.kind[i] == WHITE and kakuro.hrun[i] < 0 and kakuro.vrun[i] < 0]
+        self.batchindex = None
+
+    # returns (valid, reason), reason is None for a valid answer
+    def check(self, answer):
+        if isinstance(answer, str):
+            answer = [ord(ch) - 48 for ch in answer]
+        if len(answer) != self.N*self.N:
+            return False, "answer has {} cells instead of {}".format(len(answer), self.N*self.N)
+        for run, cells in enumerate(self.runs):
+            mask = 0
+            total = 0
+            for i in cells:
+                d = answer[i]
+                if d < 1 or d > 9:
+                    return False, "cell {} {}: {} is not a digit".format(i // self.N, i % self.N, d)
+                bit = 1 << d
+                if mask & bit:
+                    return False, "zone {}: digit {} repeated".format(run, d)
+                mask |= bit
+                total += d
+            if total != self.clues[run]:
+                return False, "zone {}: sum {} instead of {}".format(run, total, self.clues[run])
+        for i in self.lone:
+            if answer[i] < 1 or answer[i] > 9:
+                return False, "cell {} {}: {} is not a digit".format(i // self.N, i % self.N, answer[i])
+        return True, None
+
+    # (zones, 9) index of the cells of each zone, short zones are padded with the index N*N
+    # that points to an extra column holding 0
+    def batch_index(self):
+        if self.batchindex is None:
+            size = self.N*self.N
+            index = np.full((len(self.runs), 9), size, dtype=np.intp)
+            for run, cells in enumerate(self.runs):
+                index[run, :len(cells)] = cells
+            white = np.array(sorted(set(i for cells in self.runs for i in cells) | set(self.lone)), dtype=np.intp)
+            self.batchindex = (index, np.array(self.clues, dtype=np.int32), white)
+        return self.batchindex
+
+    # values of one answer, a string is read like check() does
+    def batch_row(self, answer):
+        if isinstance(answer, str):
+            return np.fromiter(map(ord, answer), dtype=np.int64, count=len(answer)) - 48
+        if isinstance(answer, (bytes, bytearray)):
+            return np.frombuffer(answer, dtype=np.uint8)
+        return np.asarray(answer, dtype=np.int64).reshape(-1)
+
+    # check many answers at once
+    #  - answers : (B, N*N) array or sequence of answers, an answer of another length is invalid
+    # returns a (B,) boolean array, True for the valid answers
+    def check_batch(self, answers):
+        if np is None:
+            raise Exception("check_batch needs numpy")
+        index, clues, white = self.batch_index()
+        size = self.N*self.N
+        if isinstance(answers, np.ndarray):
+            answers = answers.reshape(-1, size)
+        else:
+            answers = list(answers)
+            if not any(isinstance(answer, (str, bytes, bytearray)) for answer in answers):
+                try:
+                    answers = np.asarray(answers, dtype=np.int64)
+                except ValueError:
+                    # answers of different lengths
+                    pass
+        if isinstance(answers, np.ndarray) and answers.ndim == 2 and answers.shape[1] == size:
+            valid = np.ones(answers.shape[0], dtype=bool)
+        else:
+            rows = [self.batch_row(answer) for answer in answers]
+            valid = np.array([len(row) == size for row in rows], dtype=bool)
+            answers = np.zeros((len(rows), size), dtype=np.int64)
+            for k in np.flatnonzero(valid):
+                answers[k] = rows[k]
+        # values out of the digit range are clipped before the int8 cast, they stay out of 1..9
+        answers = np.clip(answers, 0, 10).astype(np.int8)
+        B = answers.shape[0]
+        # digit range of the white cells
+        wd = answers[:, white]
+        valid &= ((wd >= 1) & (wd <= 9)).all(axis=1)
+        # digits of each zone, (B, zones, 9), 0 for the padding
+        padded = np.concatenate([answers, np.zeros((B, 1), dtype=np.int8)], axis=1)
+        vals = padded[:, index].astype(np.int32)
+        valid &= (vals.sum(axis=2) == clues).all(axis=1)
+        # no repeated digit: the bits of the digits do not overlap, their sum equals their union
+        bits = np.where(vals > 0, np.left_shift(1, np.clip(vals, 0, 9)), 0)
+        valid &= (bits.sum(axis=2) == np.bitwise_or.reduce(bits, axis=2)).all(axis=1)
+        return valid
+
+# returns (valid, reason) for one answer, see SolutionChecker
+def validate(kakuro, answer):
+    return SolutionChecker(kakuro).check(answer)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the validation of answers")
+    parser.add_argument("-s","--size",help="Grid size",type=int, default=10)
+    parser.add_argument("-n","--answers",help="Number of answers",type=int, default=10000)
+    parser.add_argument("--seed",help="Seed of the random generator",type=int)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    kakuro = KakuroGrid(args.size, bcells=0.4, maxattempts=10, rng=rng)
+    while not kakuro.fill():
+        kakuro = KakuroGrid(args.size, bcells=0.4, maxattempts=10, rng=rng)
+    white = [i for i in range(kakuro.N*kakuro.N) if kakuro.kind[i] == WHITE]
+    # half of the answers have a wrong digit
+    answers = []
+    for k in range(args.answers):
+        answer = list(kakuro.digits)
+        if k % 2:
+            answer[rng.choice(white)] = rng.randint(0, 9)
+        answers.append(answer)
+
+    checker = SolutionChecker(kakuro)
+    start = time.perf_counter()
+    results = [checker.check(answer)[0] for answer in answers]
+    elapsed = time.perf_counter() - start
+    print("check      : {} answers, {} valid, {:.1f} us/answer".format(len(answers), sum(results), elapsed * 1e6 / len(answers)))
+    if np is not None:
+        start = time.perf_counter()
+        batch = checker.check_batch(answers)
+        elapsed = time.perf_counter() - start
+        print("check_batch: {} answers, {} valid, {:.1f} us/answer".format(len(answers), int(batch.sum()), elapsed * 1e6 / len(answers)))
+        assert batch.tolist() == results